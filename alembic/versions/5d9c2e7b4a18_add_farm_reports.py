@@ -0,0 +1,40 @@
+"""add farm reports
+
+Revision ID: 5d9c2e7b4a18
+Revises: e3b8a4c61f27
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5d9c2e7b4a18'
+down_revision: Union[str, None] = 'e3b8a4c61f27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('farm_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('farm_task_id', sa.Integer(), nullable=False),
+    sa.Column('user_session_id', sa.Integer(), nullable=True),
+    sa.Column('result_text', sa.Text(), nullable=True),
+    sa.Column('report_metadata', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['farm_task_id'], ['farm_tasks.id'], ),
+    sa.ForeignKeyConstraint(['user_session_id'], ['user_sessions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_farm_reports_farm_task_created', 'farm_reports', ['farm_task_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_farm_reports_farm_task_created', table_name='farm_reports')
+    op.drop_table('farm_reports')
@@ -0,0 +1,29 @@
+"""add resource_policy to farm_tasks and job_tasks
+
+Revision ID: a41c7e9b2d10
+Revises: 812be22dd13e
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c7e9b2d10'
+down_revision: Union[str, None] = '812be22dd13e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('farm_tasks', sa.Column('resource_policy', sa.String(), server_default='full', nullable=False))
+    op.add_column('job_tasks', sa.Column('resource_policy', sa.String(), server_default='full', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('job_tasks', 'resource_policy')
+    op.drop_column('farm_tasks', 'resource_policy')
@@ -0,0 +1,33 @@
+"""add proxy health check columns
+
+Revision ID: c7d2f0e5a913
+Revises: a41c7e9b2d10
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2f0e5a913'
+down_revision: Union[str, None] = 'a41c7e9b2d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('proxies', sa.Column('connect_ms', sa.Integer(), nullable=True))
+    op.add_column('proxies', sa.Column('tls_ms', sa.Integer(), nullable=True))
+    op.add_column('proxies', sa.Column('exit_ip', sa.String(), nullable=True))
+    op.add_column('proxies', sa.Column('check_error', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('proxies', 'check_error')
+    op.drop_column('proxies', 'exit_ip')
+    op.drop_column('proxies', 'tls_ms')
+    op.drop_column('proxies', 'connect_ms')
@@ -0,0 +1,35 @@
+"""add domain settle stats
+
+Revision ID: e3b8a4c61f27
+Revises: c7d2f0e5a913
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8a4c61f27'
+down_revision: Union[str, None] = 'c7d2f0e5a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'domain_settle_stats',
+        sa.Column('domain', sa.String(), nullable=False),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.Column('avg_ms', sa.Float(), nullable=False),
+        sa.Column('timeouts', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('domain'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('domain_settle_stats')
@@ -1,17 +1,31 @@
 from fastapi import FastAPI, Depends, HTTPException, Form, UploadFile, File
 from typing import Literal, Any, Optional, List
+import asyncio
 import json
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from src.config import get_db, engine
-import src.models, src.crud, src.schemas, src.tasks
+import src.models, src.crud, src.schemas, src.tasks, src.proxy_checker
 from src.models import Base, StatusEnum
 
 
+PacingName = Literal["faithful", "compressed", "turbo"]
+
+
 class FarmRunSchema(BaseModel):
     base_session_id: Optional[int] = None
     skip_substrings: Optional[List[str]] = None
     inplace: bool = False
+    pacing: PacingName = "compressed"
+    engine: Literal["selenium", "cdp"] = "selenium"
+    # необязательные навигации до реплея: проверка прокси через ipify и прогрев первым URL
+    proxy_check: bool = False
+    warmup: bool = False
+
+
+class JobRunSchema(BaseModel):
+    skip_substrings: Optional[List[str]] = None
+    pacing: PacingName = "compressed"
 
 
 # Создаем все таблицы при запуске (MVP)
@@ -29,6 +43,20 @@ def create_proxy(
     return src.crud.create_proxy(db, proxy_in)
 
 
+@app.post("/proxies/bulk", response_model=list[src.schemas.ProxyRead])
+def create_proxies_bulk(
+        proxies_in: list[src.schemas.ProxyCreate],
+        skip_failed: bool = False,
+        db: Session = Depends(get_db)
+) -> list[src.models.Proxy]:
+    # обычный def: FastAPI выполнит его в пуле потоков, синхронная Session не держит event loop;
+    # все прокси проверяются одним параллельным проходом (свой цикл asyncio) ещё до записи в БД
+    results = asyncio.run(src.proxy_checker.check_all([src.proxy_checker.ProxySpec.of(p) for p in proxies_in]))
+    # skip_failed отбрасывает только прокси, которые точно не работают, а не сбои самого чекера
+    pairs = [(p, res) for p, res in zip(proxies_in, results) if res.ok or res.inconclusive or not skip_failed]
+    return src.crud.bulk_create_proxies(db, [p for p, _ in pairs], [res for _, res in pairs])
+
+
 @app.get("/proxies/", response_model=list[src.schemas.ProxyRead])
 def list_proxies(db: Session = Depends(get_db)) -> list[src.models.Proxy]:
     return src.crud.list_proxies(db)
@@ -94,9 +122,11 @@ def run_farm_task(task_id: int, payload: FarmRunSchema, db: Session = Depends(ge
     )
 
     # Запланировать Celery-задачу
-    src.tasks.farm_cookie.delay(task_id, payload.base_session_id, ["dom-added"], payload.inplace)
+    src.tasks.farm_cookie.delay(task_id, payload.base_session_id, ["dom-added"], payload.inplace,
+                                payload.pacing, payload.engine,
+                                proxy_check=payload.proxy_check, warmup=payload.warmup)
     return {"message": "Farm task scheduled", "task_id": task_id,
-            "base_session_id": payload.base_session_id}
+            "base_session_id": payload.base_session_id, "pacing": payload.pacing, "engine": payload.engine}
 
 
 # --- UserSession Endpoints ---
@@ -123,13 +153,13 @@ def pending_job_tasks(db: Session = Depends(get_db)) -> list[src.models.JobTask]
 
 
 @app.post("/job_tasks/{job_id}/run")
-def run_job_task(job_id: int, db: Session = Depends(get_db)):
+def run_job_task(job_id: int, payload: JobRunSchema = JobRunSchema(), db: Session = Depends(get_db)):
     job = src.crud.get_job_task(db, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="JobTask not found")
-    # Запланировать Celery-задачу (псевдокод)
-    # run_job.delay(job_id)
-    return {"message": "Job task scheduled", "job_id": job_id}
+    # Запланировать Celery-задачу
+    src.tasks.run_job.delay(job_id, payload.skip_substrings or ["dom-added"], payload.pacing)
+    return {"message": "Job task scheduled", "job_id": job_id, "pacing": payload.pacing}
 
 
 # --- JobReport Endpoints ---
@@ -138,6 +168,12 @@ def get_job_reports(job_id: int, db: Session = Depends(get_db)) -> list[src.mode
     return src.crud.get_reports_by_job(db, job_id)
 
 
+# --- FarmReport Endpoints ---
+@app.get("/farm_reports/{farm_id}", response_model=list[src.schemas.FarmReportRead])
+def get_farm_reports(farm_id: int, db: Session = Depends(get_db)) -> list[src.models.FarmReport]:
+    return src.crud.get_reports_by_farm(db, farm_id)
+
+
 # --- Healthcheck ---
 @app.get("/health")
 def health():
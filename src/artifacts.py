@@ -0,0 +1,190 @@
+"""
+Артефакты упавших реплеев: скриншот, DOM и хвост лога — в каталог прогона.
+
+Раньше при ошибке шага реплей синхронно делал driver.save_screenshot в общий
+replay_fails/fail_{step:04d}.png: имена совпадали у параллельных воркеров,
+а запись PNG держала цикл реплея. Теперь у каждого прогона свой каталог
+ARTIFACTS_DIR/<задача>/<время>-<pid>-<n>/. Снимок делается через CDP сразу в
+WebP (Page.captureScreenshot), DOM (outerHTML) и последние ARTIFACT_LOG_LINES
+строк лога сжимаются zstd (если установлен zstandard, иначе gzip) и пишутся
+фоновым потоком процесса — реплей только отправляет команды CDP.
+
+Пути известны сразу, поэтому попадают в report_metadata отчёта задачи
+(RunArtifacts.summary()), даже если файл ещё дописывается. После каждой записи
+писатель удаляет прогоны старше ARTIFACTS_RETENTION_DAYS и самые старые
+прогоны сверх ARTIFACTS_MAX_MB.
+"""
+import asyncio
+import base64
+import gzip
+import itertools
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import List, Optional
+
+from src.config import settings
+
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость
+    zstandard = None
+
+MAX_DOM_BYTES = 20 * 1024 * 1024  # больше — обрезаем, такие страницы всё равно не читают глазами
+_runs = itertools.count(1)
+
+
+def compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compressed_suffix() -> str:
+    return ".zst" if zstandard is not None else ".gz"
+
+
+class ArtifactWriter:
+    """Фоновая запись артефактов процесса и уборка каталога."""
+
+    def __init__(self, root: str, max_bytes: int, retention_days: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.retention = retention_days * 86400
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=256)
+        self._thread = threading.Thread(target=self._loop, name="artifact-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str, payload, encode) -> bool:
+        """encode(payload) -> bytes выполняется уже в фоновом потоке; очередь полна — артефакт теряем."""
+        try:
+            self._queue.put_nowait((path, payload, encode))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _loop(self):
+        while True:
+            path, payload, encode = self._queue.get()
+            try:
+                data = encode(payload)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                self.written += 1
+                if self._queue.empty():
+                    self.cleanup()
+            except Exception:
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 10):
+        """Дождаться записи всего, что уже в очереди (для CLI и тестов)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _run_dirs(self) -> List[tuple]:
+        """[(mtime, путь, байт)] всех каталогов прогонов, старые первыми."""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for task in os.scandir(self.root):
+            if not task.is_dir():
+                continue
+            for run in os.scandir(task.path):
+                if not run.is_dir():
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(run.path) if f.is_file())
+                out.append((run.stat().st_mtime, run.path, size))
+        return sorted(out)
+
+    def cleanup(self):
+        runs = self._run_dirs()
+        total = sum(r[2] for r in runs)
+        cutoff = time.time() - self.retention
+        for mtime, path, size in runs:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class RunArtifacts:
+    """Каталог артефактов одного прогона и то, что в него уже отправлено."""
+
+    def __init__(self, task: str, writer: Optional["ArtifactWriter"] = None):
+        self.writer = writer or get_artifact_writer()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.dir = os.path.join(self.writer.root, task, f"{stamp}-{os.getpid()}-{next(_runs)}")
+        self.files: List[str] = []
+
+    def _submit(self, name: str, payload, encode):
+        path = os.path.join(self.dir, name)
+        if self.writer.submit(path, payload, encode):
+            self.files.append(path)
+
+    def _tail(self, prefix: str, log_lines):
+        lines = list(log_lines or ())[-settings.ARTIFACT_LOG_LINES:]
+        if lines:
+            self._submit(f"{prefix}.log{compressed_suffix()}", lines,
+                         lambda v: compress("\n".join(v).encode()))
+
+    def _results(self, prefix: str, shot: Optional[dict], dom: Optional[dict]):
+        if shot and shot.get("data"):
+            self._submit(f"{prefix}.webp", shot["data"], base64.b64decode)
+        html = ((dom or {}).get("result") or {}).get("value")
+        if isinstance(html, str):
+            self._submit(f"{prefix}.html{compressed_suffix()}", html,
+                         lambda v: compress(v.encode()[:MAX_DOM_BYTES]))
+
+    # команды снимка: WebP делает сам Chrome, DOM — outerHTML документа
+    SHOT = ("Page.captureScreenshot", {"format": "webp", "quality": 80})
+    DOM = ("Runtime.evaluate", {"expression": "document.documentElement && document.documentElement.outerHTML",
+                                "returnByValue": True})
+
+    def capture(self, cdp, step: int, log_lines=None, timeout: float = 10):
+        """Снимок вкладки через её CDP-канал (src.cdp); ждём только ответы Chrome, запись — в фоне."""
+        prefix = f"fail_{step:04d}"
+        self._tail(prefix, log_lines)
+        futs = [cdp.send_nowait(*self.SHOT), cdp.send_nowait(*self.DOM)]
+        results = []
+        for fut in futs:
+            try:
+                results.append(fut.result(timeout))
+            except Exception:
+                results.append(None)
+        self._results(prefix, *results)
+
+    async def capture_async(self, conn, session_id: str, step: int, log_lines=None, timeout: float = 10):
+        """То же для target-сессии asyncio-движка (src.cdp_engine)."""
+        prefix = f"fail_{step:04d}"
+        self._tail(prefix, log_lines)
+        results = await asyncio.gather(*(conn.send(m, p, session_id, timeout) for m, p in (self.SHOT, self.DOM)),
+                                       return_exceptions=True)
+        self._results(prefix, *(None if isinstance(r, BaseException) else r for r in results))
+
+    def summary(self) -> dict:
+        return {"dir": self.dir, "files": list(self.files)}
+
+
+_writer: Optional[ArtifactWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_artifact_writer() -> ArtifactWriter:
+    """Писатель процесса (поток стартует при первом обращении)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ArtifactWriter(settings.ARTIFACTS_DIR, settings.ARTIFACTS_MAX_MB * 1024 * 1024,
+                                     settings.ARTIFACTS_RETENTION_DAYS)
+        return _writer
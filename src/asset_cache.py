@@ -0,0 +1,335 @@
+"""
+Общий кэш статических ассетов (JS, CSS, шрифты, картинки) для всех сессий хоста.
+
+Каждый свежий профиль Chrome заново качал через прокси одни и те же бандлы
+целевых сайтов. AssetCache хранит тела по sha256 — одна копия на содержимое,
+сколько бы URL на него ни ссылалось — в ASSET_CACHE_DIR, а индекс URL → тело
+в sqlite рядом; их видят все процессы воркеров хоста. Размер ограничен
+ASSET_CACHE_MAX_MB, вытесняются давно не использованные URL (LRU).
+
+Хранятся только ответы, которые можно отдавать из общего кэша: GET 200, без
+Set-Cookie, Cache-Control без no-store / no-cache / private, со s-maxage /
+max-age или Expires, Vary не шире Accept-Encoding. Отдаются они, пока свежие;
+ревалидации нет — устаревший ассет просто качается заново.
+
+AssetTap подключает кэш к FetchRouter вкладки (src.interception): запросы
+останавливаются только на стадии запроса, поиск идёт в пуле I/O (не в потоке,
+который разносит события вкладки), попадание отдаётся Fetch.fulfillRequest.
+Стадию ответа получают только промахи (continueRequest с interceptResponse):
+Fetch.getResponseBody и постановка тела в очередь фонового писателя, который
+пишет файл, индекс и раз в EVICT_EVERY записей (или при переполнении по
+оценке) пересчитывает размер и вытесняет старое. Ответы из кэша не попадают
+в байты прокси ResourceBlocker. Счётчики попаданий и сэкономленных байт есть
+у реплея (AssetTap) и у кэша процесса (AssetCache).
+
+Кэш выключен по умолчанию (ASSET_CACHE_MAX_MB=0): перехват ассетов — лишняя
+пауза на каждом запросе, окупается он на хостах с многими сессиями одних сайтов.
+"""
+import base64
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+
+from src.config import settings
+from src.interception import DEFER
+
+CACHEABLE_TYPES = ("Script", "Stylesheet", "Font", "Image")
+MAX_ASSET_BYTES = 5 * 1024 * 1024
+EVICT_EVERY = 256  # полный пересчёт размера кэша (его дописывают и соседние процессы)
+# тело в кэше уже раскодировано, длину Chrome посчитает сам; куки и возраст ответа не переносим
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie",
+                "date", "age", "connection", "keep-alive"}
+
+
+def header_map(headers: List[dict]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for h in headers or ():
+        name = h.get("name", "").lower()
+        out[name] = f"{out[name]}, {h.get('value', '')}" if name in out else h.get("value", "")
+    return out
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness(headers: Dict[str, str], now: float) -> Optional[float]:
+    """Сколько секунд ответ можно отдавать из общего кэша; None — хранить нельзя."""
+    if "set-cookie" in headers:
+        return None
+    vary = {v.strip().lower() for v in headers.get("vary", "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return None
+    cc: Dict[str, str] = {}
+    for part in headers.get("cache-control", "").split(","):
+        key, _, value = part.strip().lower().partition("=")
+        if key:
+            cc[key] = value.strip('"')
+    if {"no-store", "no-cache", "private"} & cc.keys():
+        return None
+    for key in ("s-maxage", "max-age"):
+        if key in cc:
+            try:
+                ttl = float(cc[key])
+            except ValueError:
+                return None
+            return ttl if ttl > 0 else None
+    expires = _http_date(headers.get("expires"))
+    if expires is None:
+        return None
+    ttl = expires - (_http_date(headers.get("date")) or now)
+    return ttl if ttl > 0 else None
+
+
+@dataclass
+class CachedAsset:
+    status: int
+    headers: List[dict]  # [{name, value}], как в Fetch.fulfillRequest
+    body: bytes
+    wire_size: int       # сколько байт ответ занял бы в сети (Content-Length), для учёта экономии
+
+
+class AssetCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=10,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS assets (url TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+            "status INTEGER NOT NULL, headers TEXT NOT NULL, size INTEGER NOT NULL, "
+            "wire_size INTEGER NOT NULL, expires REAL NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_assets_last_used ON assets (last_used)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_assets_digest ON assets (digest)")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.dropped = 0
+        self.bytes_saved = 0
+        self._approx = self._stored_bytes()  # оценка размера между пересчётами
+        self._since_evict = 0
+        self._writes: queue.Queue = queue.Queue(maxsize=256)
+        self._writer = threading.Thread(target=self._write_loop, name="asset-cache-writer", daemon=True)
+        self._writer.start()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    # ---------- чтение -----------------------------------------------------
+
+    def get(self, url: str) -> Optional[CachedAsset]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, status, headers, wire_size FROM assets WHERE url = ? AND expires > ?",
+                (url, now)).fetchone()
+            if row:
+                self._db.execute("UPDATE assets SET last_used = ? WHERE url = ?", (now, url))
+        asset = None
+        if row:
+            try:
+                with open(self._path(row[0]), "rb") as f:
+                    asset = CachedAsset(row[1], json.loads(row[2]), f.read(), row[3])
+            except OSError:
+                pass  # тело вытеснил соседний процесс
+        with self._lock:
+            if asset:
+                self.hits += 1
+                self.bytes_saved += asset.wire_size
+            else:
+                self.misses += 1
+        return asset
+
+    # ---------- запись -----------------------------------------------------
+
+    def put_async(self, url: str, status: int, headers: List[dict], body: bytes, wire_size: int, ttl: float):
+        """Запись уходит фоновому писателю; очередь полна — ассет просто не кэшируем."""
+        try:
+            self._writes.put_nowait((url, status, headers, body, wire_size, ttl))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            try:
+                self.put(*item)
+            except Exception:
+                with self._lock:
+                    self.dropped += 1
+            finally:
+                self._writes.task_done()
+
+    def put(self, url: str, status: int, headers: List[dict], body: bytes, wire_size: int, ttl: float):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)  # атомарно: параллельные процессы пишут одинаковое содержимое
+            self._approx += len(body)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, status, json.dumps(headers), len(body), wire_size, now + ttl, now))
+            self.stored += 1
+            self._since_evict += 1
+            if self._approx > self.max_bytes or self._since_evict >= EVICT_EVERY:
+                self._since_evict = 0
+                self._approx = self._evict()
+
+    def _stored_bytes(self) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM assets GROUP BY digest)"
+        ).fetchone()[0]
+
+    def _evict(self) -> int:
+        """Вытесняет LRU-записи сверх max_bytes; возвращает размер кэша после."""
+        total = self._stored_bytes()
+        while total > self.max_bytes:
+            victims = self._db.execute("SELECT url, digest, size FROM assets ORDER BY last_used LIMIT 64").fetchall()
+            if not victims:
+                break
+            for url, digest, size in victims:
+                self._db.execute("DELETE FROM assets WHERE url = ?", (url,))
+                if self._db.execute("SELECT 1 FROM assets WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                    continue  # тело нужно другому URL
+                try:
+                    os.remove(self._path(digest))
+                except OSError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        return total
+
+    def summary(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved, "stored": self.stored, "dropped": self.dropped,
+                "size": self._approx, "max_size": self.max_bytes,
+            }
+
+
+class AssetTap:
+    """Кэш ассетов во вкладках одного реплея (обработчик FetchRouter) и счётчики этого реплея."""
+
+    def __init__(self, cache: AssetCache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.bytes_saved = 0
+        self.on_hit: Optional[Callable[[Optional[str]], None]] = None  # ResourceBlocker.mark_local
+        self._lock = threading.Lock()
+
+    def attach(self, router, blocker=None):
+        """blocker — ResourceBlocker вкладки: ответы из кэша он не считает байтами прокси."""
+        if blocker is not None:
+            self.on_hit = blocker.mark_local
+        router.add(self.decide, [{"resourceType": t, "requestStage": "Request"} for t in CACHEABLE_TYPES])
+
+    def decide(self, params: dict):
+        req = params.get("request", {})
+        url = req.get("url", "").split("#")[0]
+        if params.get("resourceType") not in CACHEABLE_TYPES:
+            return None  # остановлен чужим шаблоном (например, авторизация прокси)
+        if req.get("method", "GET") != "GET" or not url.startswith(("http://", "https://")):
+            return None
+        if "responseErrorReason" in params:
+            return None
+        if "responseStatusCode" in params:
+            return self._store(params, url)
+        return DEFER, lambda: self._lookup(params, url)
+
+    def _lookup(self, params: dict, url: str):
+        """В пуле I/O: попадание — ответ из кэша, промах — продолжить и остановить ответ для записи."""
+        asset = self.cache.get(url)
+        with self._lock:
+            if asset is None:
+                self.misses += 1
+                return "Fetch.continueRequest", {"requestId": params["requestId"], "interceptResponse": True}
+            self.hits += 1
+            self.bytes_saved += asset.wire_size
+        if self.on_hit:
+            self.on_hit(params.get("networkId"))
+        return "Fetch.fulfillRequest", {
+            "requestId": params["requestId"], "responseCode": asset.status,
+            "responseHeaders": asset.headers, "body": base64.b64encode(asset.body).decode(),
+        }
+
+    def _store(self, params: dict, url: str):
+        if params["responseStatusCode"] != 200:
+            return None
+        headers = params.get("responseHeaders") or []
+        hmap = header_map(headers)
+        ttl = freshness(hmap, time.time())
+        if ttl is None:
+            return None
+        try:
+            wire_size = int(hmap.get("content-length", ""))
+        except ValueError:
+            wire_size = None
+        if wire_size is not None and wire_size > MAX_ASSET_BYTES:
+            return None
+
+        def save(result: dict):
+            raw = result.get("body", "")
+            body = base64.b64decode(raw) if result.get("base64Encoded") else raw.encode()
+            if len(body) <= MAX_ASSET_BYTES:
+                kept = [h for h in headers if h.get("name", "").lower() not in DROP_HEADERS]
+                self.cache.put_async(url, 200, kept, body, wire_size or len(body), ttl)
+                with self._lock:
+                    self.stored += 1
+            return None  # дальше — обычный Fetch.continueRequest
+
+        return "Fetch.getResponseBody", {"requestId": params["requestId"]}, save
+
+    def summary(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved, "stored": self.stored,
+        }
+
+
+_cache: Optional[AssetCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_asset_cache() -> Optional[AssetCache]:
+    """Кэш текущего процесса (индекс и тела общие для хоста); None, если ASSET_CACHE_MAX_MB=0."""
+    global _cache
+    if settings.ASSET_CACHE_MAX_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AssetCache(settings.ASSET_CACHE_DIR, settings.ASSET_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
+
+
+def open_tap() -> Optional[AssetTap]:
+    """AssetTap для одного реплея или None, если кэш выключен."""
+    cache = get_asset_cache()
+    return AssetTap(cache) if cache else None
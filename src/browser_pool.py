@@ -0,0 +1,240 @@
+"""
+Пул прогретых Chrome для воркеров Celery.
+
+Запуск uc.Chrome (патч chromedriver + холодный старт браузера) стоит секунды,
+поэтому браузеры поднимаются заранее и выдаются задачам в аренду:
+
+    pool = get_browser_pool()
+    with pool.leased(proxy="127.0.0.1:8899") as driver:
+        replay_events(events, driver=driver)
+
+Между арендами браузер сбрасывается (лишние вкладки, куки, storage, CDP-оверрайды),
+а после BROWSER_POOL_MAX_LEASES аренд — пересоздаётся.
+
+--proxy-server задаётся при запуске Chrome, поэтому простаивающие браузеры
+разложены по прокси. Места в пуле делятся между прокси, которые недавно
+арендовали (не больше size ключей): промах по ключу запускает браузер сразу и
+в фоне готовит следующий для того же прокси, а при переполнении выкидываются
+браузеры ключей сверх их доли или тех, что давно не арендовали.
+Пул живёт в процессе воркера: при prefork у каждого дочернего процесса он свой.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from urllib.parse import urlparse
+
+from src.config import settings
+import src.replayer_new
+
+
+@dataclass
+class PooledBrowser:
+    driver: Any
+    proxy: Optional[str] = None  # --proxy-server, с которым запущен браузер
+    leases: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+def reset_browser(driver):
+    """
+    Возвращает браузер к «чистому» состоянию между арендами:
+    одна свежая вкладка (новый target — без CDP-оверрайдов и инжект-скриптов),
+    пустые куки, storage посещённых origin-ов и HTTP-кэш.
+    """
+    handles = driver.window_handles
+    origins: set[str] = set()
+    for h in handles:
+        driver.switch_to.window(h)
+        u = urlparse(driver.current_url)
+        if u.scheme in ("http", "https"):
+            origins.add(f"{u.scheme}://{u.netloc}")
+    # куки помнят и те сайты, которые уже не открыты ни в одной вкладке
+    for ck in driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", []):
+        d = ck.get("domain", "").lstrip(".")
+        if d:
+            origins.update((f"https://{d}", f"http://{d}"))
+
+    driver.switch_to.new_window("tab")
+    fresh = driver.current_window_handle
+    for h in handles:
+        driver.switch_to.window(h)
+        driver.close()
+    driver.switch_to.window(fresh)
+
+    for origin in origins:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+
+
+class BrowserPool:
+    """
+    Держит до size простаивающих браузеров и выдаёт их в аренду по ключу proxy.
+    Если подходящего свободного нет — запускает новый (аренда не блокируется).
+    """
+
+    def __init__(self, size: int, max_leases: int, launcher: Optional[Callable[..., Any]] = None):
+        self.size = size
+        self.max_leases = max_leases
+        self._launcher = launcher or src.replayer_new.launch_driver
+        self._idle: list[PooledBrowser] = []
+        # прокси, под которые держим прогретые браузеры: недавно арендованные — в конце
+        self._keys: "OrderedDict[Optional[str], None]" = OrderedDict()
+        self._warming: set[Optional[str]] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # ---------- lifecycle -------------------------------------------------
+
+    def warm(self, proxy: Optional[str] = None):
+        """Добирает прогретые браузеры с данным proxy до его доли пула и держит их такими."""
+        with self._lock:
+            self._touch(proxy)
+            missing = self._share() - sum(1 for b in self._idle if b.proxy == proxy)
+        for _ in range(max(0, missing)):
+            pb = self._launch(proxy)
+            self._put_idle(pb)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for pb in idle:
+            self._discard(pb)
+
+    # ---------- leasing ---------------------------------------------------
+
+    def lease(self, proxy: Optional[str] = None) -> PooledBrowser:
+        while True:
+            with self._lock:
+                self._touch(proxy)
+                pb = next((b for b in reversed(self._idle) if b.proxy == proxy), None)
+                if pb:
+                    self._idle.remove(pb)
+            if pb is None:
+                # промах: этот запускаем сейчас, следующему с тем же прокси готовим в фоне
+                self._refill_async(proxy)
+                return self._launch(proxy)
+            if self._alive(pb):
+                self._refill_async(proxy)
+                return pb
+            self._discard(pb)
+
+    def release(self, pb: PooledBrowser, broken: bool = False):
+        pb.leases += 1
+        if broken or self._closed or pb.leases >= self.max_leases:
+            self._discard(pb)
+            self._refill_async(pb.proxy)
+            return
+        try:
+            reset_browser(pb.driver)
+        except Exception:
+            self._discard(pb)
+            self._refill_async(pb.proxy)
+            return
+        self._put_idle(pb)
+
+    @contextmanager
+    def leased(self, proxy: Optional[str] = None):
+        pb = self.lease(proxy)
+        try:
+            yield pb.driver
+        except BaseException:
+            # после упавшего реплея состояние браузера непредсказуемо — не возвращаем его в пул
+            self.release(pb, broken=True)
+            raise
+        else:
+            self.release(pb)
+
+    # ---------- internals -------------------------------------------------
+
+    def _launch(self, proxy: Optional[str]) -> PooledBrowser:
+        return PooledBrowser(driver=self._launcher(proxy=proxy), proxy=proxy)
+
+    def _touch(self, proxy: Optional[str]):
+        """Отмечает прокси как используемый; самый давний ключ сверх size забывается (под _lock)."""
+        self._keys[proxy] = None
+        self._keys.move_to_end(proxy)
+        while len(self._keys) > max(1, self.size):
+            self._keys.popitem(last=False)
+
+    def _share(self) -> int:
+        """Сколько простаивающих браузеров держим на один используемый прокси (под _lock)."""
+        return max(1, self.size // max(1, len(self._keys)))
+
+    def _victim(self) -> PooledBrowser:
+        """Кого выкинуть при переполнении: ключ уже не используется или сверх доли, иначе самый старый."""
+        share = self._share()
+        counts: dict = {}
+        for b in self._idle:
+            counts[b.proxy] = counts.get(b.proxy, 0) + 1
+        for b in self._idle:
+            if b.proxy not in self._keys or counts[b.proxy] > share:
+                return b
+        return self._idle[0]
+
+    def _put_idle(self, pb: PooledBrowser):
+        evicted = []
+        with self._lock:
+            if self._closed:
+                evicted.append(pb)
+            else:
+                self._idle.append(pb)
+                while len(self._idle) > self.size:
+                    victim = self._victim()
+                    self._idle.remove(victim)
+                    evicted.append(victim)
+        for old in evicted:
+            self._discard(old)
+
+    def _refill_async(self, proxy: Optional[str]):
+        """Фоновый warm(proxy), если у ключа меньше его доли и он ещё не греется."""
+        with self._lock:
+            if self._closed or proxy not in self._keys or proxy in self._warming:
+                return
+            if sum(1 for b in self._idle if b.proxy == proxy) >= self._share():
+                return
+            self._warming.add(proxy)
+
+        def run():
+            try:
+                self.warm(proxy)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._warming.discard(proxy)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def _alive(pb: PooledBrowser) -> bool:
+        try:
+            return bool(pb.driver.window_handles)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(pb: PooledBrowser):
+        try:
+            pb.driver.quit()
+        except Exception:
+            pass
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> Optional[BrowserPool]:
+    """Пул текущего процесса; None, если пул выключен (BROWSER_POOL_SIZE=0)."""
+    global _pool
+    if settings.BROWSER_POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(settings.BROWSER_POOL_SIZE, settings.BROWSER_POOL_MAX_LEASES)
+        return _pool
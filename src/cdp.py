@@ -0,0 +1,194 @@
+"""
+Прямой CDP-канал к вкладке поверх websocket (websocket-client).
+
+driver.execute_cdp_cmd — это отдельный HTTP-запрос к chromedriver на каждую
+команду, ответ ждём синхронно. CDPChannel подключается к той же вкладке
+напрямую по debuggerAddress и позволяет:
+  • отправлять команды пачкой, не дожидаясь ответов (send_nowait);
+  • подписываться на CDP-события (on) — их разбирает фоновый поток-читатель;
+  • работать с flatten-сессиями целей, подключённых через Target.setAutoAttach
+    (session_id в send/on) — так open_browser_channel видит попапы и воркеры.
+Если прямое подключение невозможно, open_tab_channel возвращает DriverCDP —
+тот же интерфейс поверх execute_cdp_cmd.
+"""
+import itertools
+import json
+import threading
+import urllib.request
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import websocket
+
+
+class CDPError(RuntimeError):
+    pass
+
+
+class CDPChannel:
+    def __init__(self, ws_url: str, target_id: str = ""):
+        self.target_id = target_id
+        self.ws = websocket.create_connection(ws_url, suppress_origin=True, enable_multithread=True)
+        self.commands_sent = 0
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._listeners: Dict[tuple, List[Callable[[dict], None]]] = {}  # (session_id, метод) → колбэки
+        self._lock = threading.Lock()
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    # ---------- commands --------------------------------------------------
+
+    def send_nowait(self, method: str, params: Optional[dict] = None, session_id: Optional[str] = None) -> Future:
+        fut: Future = Future()
+        msg_id = next(self._ids)
+        with self._lock:
+            if self.closed:
+                raise CDPError("CDP channel is closed")
+            self._pending[msg_id] = fut
+        msg = {"id": msg_id, "method": method, "params": params or {}}
+        if session_id:
+            msg["sessionId"] = session_id
+        self.commands_sent += 1
+        self.ws.send(json.dumps(msg))
+        return fut
+
+    def send(self, method: str, params: Optional[dict] = None, timeout: float = 10,
+             session_id: Optional[str] = None) -> dict:
+        return self.send_nowait(method, params, session_id).result(timeout)
+
+    def send_batch(self, commands: List[tuple], timeout: float = 10) -> List[dict]:
+        """Отправляет все команды подряд и только потом ждёт ответы."""
+        futs = [self.send_nowait(m, p) for m, p in commands]
+        return [f.result(timeout) for f in futs]
+
+    # ---------- events ----------------------------------------------------
+
+    def on(self, event: str, callback: Callable[[dict], None], session_id: Optional[str] = None):
+        self._listeners.setdefault((session_id, event), []).append(callback)
+
+    def off(self, event: str, callback: Callable[[dict], None], session_id: Optional[str] = None):
+        cbs = self._listeners.get((session_id, event), [])
+        if callback in cbs:
+            cbs.remove(callback)
+
+    def off_session(self, session_id: str):
+        for key in [k for k in self._listeners if k[0] == session_id]:
+            del self._listeners[key]
+
+    # ---------- internals -------------------------------------------------
+
+    def _read_loop(self):
+        try:
+            while True:
+                raw = self.ws.recv()
+                if not raw:
+                    break
+                msg = json.loads(raw)
+                if "id" in msg:
+                    with self._lock:
+                        fut = self._pending.pop(msg["id"], None)
+                    if fut is None:
+                        continue
+                    if "error" in msg:
+                        fut.set_exception(CDPError(msg["error"].get("message", str(msg["error"]))))
+                    else:
+                        fut.set_result(msg.get("result", {}))
+                else:
+                    for cb in list(self._listeners.get((msg.get("sessionId"), msg.get("method")), ())):
+                        try:
+                            cb(msg.get("params", {}))
+                        except Exception:
+                            pass
+        except Exception:
+            pass
+        finally:
+            self._fail_pending()
+
+    def _fail_pending(self):
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(CDPError("CDP channel closed"))
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+        self._fail_pending()
+
+
+class DriverCDP:
+    """Запасной вариант с интерфейсом CDPChannel поверх driver.execute_cdp_cmd (без событий)."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.commands_sent = 0
+        self.closed = False
+
+    def send_nowait(self, method: str, params: Optional[dict] = None) -> Future:
+        fut: Future = Future()
+        self.commands_sent += 1
+        try:
+            fut.set_result(self.driver.execute_cdp_cmd(method, params or {}))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def send(self, method: str, params: Optional[dict] = None, timeout: float = 10) -> dict:
+        return self.send_nowait(method, params).result(timeout)
+
+    def send_batch(self, commands: List[tuple], timeout: float = 10) -> List[dict]:
+        return [self.send(m, p) for m, p in commands]
+
+    def on(self, event: str, callback: Callable[[dict], None]):
+        pass
+
+    def off(self, event: str, callback: Callable[[dict], None]):
+        pass
+
+    def close(self):
+        pass
+
+
+def debugger_address(driver) -> Optional[str]:
+    caps = getattr(driver, "capabilities", None) or {}
+    addr = (caps.get("goog:chromeOptions") or {}).get("debuggerAddress")
+    if not addr:
+        addr = getattr(getattr(driver, "options", None), "debugger_address", None)
+    return addr
+
+
+def open_tab_channel(driver) -> Any:
+    """
+    Канал к вкладке, активной сейчас в driver. CDPChannel, если доступен
+    debuggerAddress, иначе DriverCDP.
+    """
+    addr = debugger_address(driver)
+    if addr:
+        try:
+            target_id = driver.execute_cdp_cmd("Target.getTargetInfo", {})["targetInfo"]["targetId"]
+            return CDPChannel(f"ws://{addr}/devtools/page/{target_id}", target_id)
+        except Exception:
+            pass
+    return DriverCDP(driver)
+
+
+def open_browser_channel(driver) -> Optional[CDPChannel]:
+    """
+    Канал к браузеру целиком (а не к вкладке) — для Target.setAutoAttach.
+    None, если debuggerAddress недоступен.
+    """
+    addr = debugger_address(driver)
+    if not addr:
+        return None
+    try:
+        with urllib.request.urlopen(f"http://{addr}/json/version", timeout=5) as resp:
+            ws_url = json.loads(resp.read())["webSocketDebuggerUrl"]
+        return CDPChannel(ws_url)
+    except Exception:
+        return None
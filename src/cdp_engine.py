@@ -0,0 +1,1022 @@
+"""
+Asyncio-движок реплея поверх CDP (websockets).
+
+replay_events — синхронный Selenium: слот воркера занят весь реплей, причём
+большую часть времени спит. Здесь процесс воркера держит один event loop в
+фоновом потоке и общий Chrome (без chromedriver), а каждый реплей идёт в
+собственном browser context со своими вкладками: паузы — asyncio.sleep,
+поэтому десятки реплеев идут параллельно.
+
+Контексты изолированы друг от друга: свои куки и storage, свой прокси
+(proxyServer контекста), свои UA и эмуляция (ContextProfile) — в том числе
+во вкладках и OOPIF, которые открывает сама страница (auto-attach).
+Один Chrome держит до CDP_ENGINE_CONTEXTS_PER_BROWSER контекстов, дальше
+движок поднимает следующий.
+
+Исполняется тот же ExecutionPlan, что и в replay_events, и контракт тот же —
+(cookies, user_agent). Из синхронного кода (задачи Celery, -P threads)
+вызывается через get_cdp_engine().replay_sync(...).
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import websockets
+
+from src.cdp import CDPError
+from src.config import settings
+from src.consent import ConsentDismisser
+from src.cookie_jar import CookieJar, from_cdp_cookie, to_cdp_cookie
+from src.interception import DEFAULT_RESOURCE_POLICY, FetchRouter, ResourceBlocker
+from src.asset_cache import AssetTap, open_tap
+from src.settle import PageSettler, SettleBook
+from src.instrumentation import ERROR, OK, SKIPPED, UNRESOLVED, StepRecorder
+from src.artifacts import RunArtifacts
+from src.replay_log import DEBUG, RunLogger, level_of
+from src.element_resolver import WAIT_JS, resolver_payload
+from src.pacing import AsyncPacer, DEFAULT_POLICY
+from src.plan_compiler import ExecutionPlan, Step, compile_plan
+from src.pointer_input import (
+    adispatch, build_timeline, click_events, drag_events, hover_timeline, move_events,
+)
+from src.replayer_new import (
+    STEALTH_JS, TabState, is_captcha_url, log, normalize_href, pick_chrome_ua,
+)
+
+# Поиск элемента: WAIT_JS (каскад стратегий + MutationObserver) как промис,
+# наружу — центр элемента в координатах вьюпорта фрейма.
+LOCATE_JS = "new Promise(done => (function() {" + WAIT_JS + "}).call(null, %s, %d, done)).then(r => {" + r"""
+  if (!r) return null;
+  const el = r[0];
+  let b = el.getBoundingClientRect();
+  if (b.bottom < 0 || b.top > innerHeight || b.right < 0 || b.left > innerWidth) {
+    el.scrollIntoView({block: "center"});
+    b = el.getBoundingClientRect();
+  }
+  return {strategy: r[1], x: b.x + b.width / 2, y: b.y + b.height / 2, w: b.width, h: b.height};
+})"""
+
+# key → (code, windowsVirtualKeyCode, text) для Input.dispatchKeyEvent
+SPECIAL_KEYS = {
+    "Backspace": ("Backspace", 8, ""),
+    "Enter": ("Enter", 13, "\r"),
+    "Tab": ("Tab", 9, ""),
+    " ": ("Space", 32, " "),
+    "Spacebar": ("Space", 32, " "),
+}
+# битовая маска modifiers CDP
+MODIFIERS = (("altKey", 1), ("ctrlKey", 2), ("metaKey", 4), ("shiftKey", 8))
+
+INTERACTIVE_TYPES = {"click", "wheel", "scroll", "keydown", "input",
+                     "drag_sequence", "form_submit", "hover", "hover_generic"}
+
+
+# ---------- context profile ------------------------------------------------
+
+@dataclass
+class ContextProfile:
+    """Всё, чем один контекст отличается от соседних в том же Chrome."""
+    user_agent: str
+    proxy: Optional[str] = None
+    proxy_auth: Optional[Tuple[str, str]] = None  # ответ на Fetch.authRequired прокси контекста
+    timezone: str = "Europe/Moscow"
+    accept_language: str = "en-US,en;q=0.9"
+    platform: str = "Win32"
+    hardware_concurrency: int = field(default_factory=lambda: random.choice([4, 8, 12]))
+
+    def context_params(self) -> dict:
+        params = {"disposeOnDetach": True}
+        if self.proxy:
+            # тот же формат правил, что и --proxy-server в build_chrome_options
+            params["proxyServer"] = f"http={self.proxy};https={self.proxy}"
+        return params
+
+
+async def apply_emulation(conn: "CDPConnection", session_id: str, profile: ContextProfile):
+    """UA, язык, часовой пояс и stealth-патч для одной target-сессии."""
+    send = lambda method, params: conn.send(method, params, session_id)
+    await asyncio.gather(
+        send("Emulation.setUserAgentOverride", {
+            "userAgent": profile.user_agent, "acceptLanguage": profile.accept_language,
+            "platform": profile.platform}),
+        send("Emulation.setTimezoneOverride", {"timezoneId": profile.timezone}),
+        send("Page.addScriptToEvaluateOnNewDocument", {
+            "source": f"window.__originalUA = '{profile.user_agent}';\n{STEALTH_JS}"}),
+    )
+    try:
+        await send("Emulation.setHardwareConcurrencyOverride",
+                   {"hardwareConcurrency": profile.hardware_concurrency})
+    except CDPError:
+        pass
+
+
+# ---------- transport ------------------------------------------------------
+
+class CDPConnection:
+    """Браузерное websocket-соединение; вкладки — flatten-сессии (sessionId в сообщении)."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.commands_sent = 0
+        self.sent_by_session: Dict[Optional[str], int] = defaultdict(int)  # для профиля реплея
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._listeners: Dict[tuple, List[Callable[[dict], None]]] = {}
+        self._reader = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, ws_url: str) -> "CDPConnection":
+        ws = await websockets.connect(ws_url, max_size=None, ping_interval=None)
+        return cls(ws)
+
+    async def send(self, method: str, params: Optional[dict] = None, session_id: Optional[str] = None,
+                   timeout: float = 30) -> dict:
+        if self.closed:
+            raise CDPError("CDP connection is closed")
+        msg_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        msg = {"id": msg_id, "method": method, "params": params or {}}
+        if session_id:
+            msg["sessionId"] = session_id
+        self.commands_sent += 1
+        self.sent_by_session[session_id] += 1
+        try:
+            await self.ws.send(json.dumps(msg))
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._pending.pop(msg_id, None)
+
+    def on(self, method: str, callback: Callable[[dict], None], session_id: Optional[str] = None):
+        self._listeners.setdefault((session_id, method), []).append(callback)
+
+    def off_session(self, session_id: str):
+        for key in [k for k in self._listeners if k[0] == session_id]:
+            del self._listeners[key]
+        self.sent_by_session.pop(session_id, None)
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.ws:
+                msg = json.loads(raw)
+                if "id" in msg:
+                    fut = self._pending.get(msg["id"])
+                    if fut is None or fut.done():
+                        continue
+                    if "error" in msg:
+                        fut.set_exception(CDPError(msg["error"].get("message", str(msg["error"]))))
+                    else:
+                        fut.set_result(msg.get("result", {}))
+                    continue
+                for cb in list(self._listeners.get((msg.get("sessionId"), msg.get("method")), ())):
+                    try:
+                        cb(msg.get("params", {}))
+                    except Exception:
+                        pass
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(CDPError("CDP connection closed"))
+
+    async def close(self):
+        self.closed = True
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+
+class ChromeProcess:
+    """
+    Chrome, запущенный напрямую с --remote-debugging-port (без chromedriver и uc).
+    Прокси у самого браузера нет — он задаётся каждому контексту.
+    """
+
+    def __init__(self):
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.conn: Optional[CDPConnection] = None
+        self.user_data_dir = ""
+        self.contexts = 0  # сколько реплеев сейчас держат контекст в этом браузере
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.proc and self.proc.returncode is None and self.conn and not self.conn.closed)
+
+    async def start(self, timeout: float = 30):
+        from undetected_chromedriver import find_chrome_executable
+        binary = find_chrome_executable()
+        if not binary:
+            raise RuntimeError("Chrome executable not found")
+        self.user_data_dir = tempfile.mkdtemp(prefix="cdp-engine-")
+        args = [
+            binary,
+            "--remote-debugging-port=0",
+            f"--user-data-dir={self.user_data_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-blink-features=AutomationControlled",
+            "--ignore-certificate-errors",
+            "--allow-insecure-localhost",
+        ]
+        if settings.CDP_ENGINE_HEADLESS:
+            args.append("--headless=new")
+        args.append("about:blank")
+        self.proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+
+        # порт и путь браузерного websocket Chrome пишет в DevToolsActivePort
+        port_file = os.path.join(self.user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with open(port_file, "r", encoding="utf-8") as f:
+                    lines = f.read().split()
+                if len(lines) >= 2:
+                    break
+            except OSError:
+                pass
+            if self.proc.returncode is not None or time.monotonic() > deadline:
+                await self.stop()
+                raise RuntimeError("Chrome did not expose DevTools endpoint")
+            await asyncio.sleep(0.1)
+        self.conn = await CDPConnection.connect(f"ws://127.0.0.1:{lines[0]}{lines[1]}")
+
+    async def stop(self):
+        if self.conn:
+            try:
+                await self.conn.send("Browser.close", timeout=5)
+            except Exception:
+                pass
+            await self.conn.close()
+        if self.proc and self.proc.returncode is None:
+            try:
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+# ---------- page -----------------------------------------------------------
+
+class Page:
+    """Вкладка (target) внутри browser context реплея."""
+
+    def __init__(self, conn: CDPConnection, target_id: str, session_id: str):
+        self.conn = conn
+        self.target_id = target_id
+        self.session_id = session_id
+        self.url = "about:blank"
+        self.pointer_pos = (0, 0)
+        self._loaded = asyncio.Event()
+        self._navigated = asyncio.Event()
+        # цепочка iframe → (session, executionContextId, смещение во вьюпорте)
+        self._frames: Dict[tuple, Tuple[str, int, Tuple[float, float]]] = {}
+        self._dom_sessions: set = set()
+        # frameId OOPIF → сессия его target (заполняет AsyncReplay при автоподключении)
+        self.frame_sessions: Dict[str, str] = {}
+        self.settler: Optional[PageSettler] = None  # без него навигации ждут load, как раньше
+        self.recorder: Optional[StepRecorder] = None
+        self.logger: Optional[RunLogger] = None
+        conn.on("Page.frameNavigated", self._on_frame_navigated, session_id)
+        conn.on("Page.loadEventFired", lambda _: self._loaded.set(), session_id)
+
+    @classmethod
+    async def open(cls, conn: CDPConnection, context_id: str) -> "Page":
+        target_id = (await conn.send("Target.createTarget",
+                                     {"url": "about:blank", "browserContextId": context_id}))["targetId"]
+        session_id = (await conn.send("Target.attachToTarget",
+                                      {"targetId": target_id, "flatten": True}))["sessionId"]
+        page = cls(conn, target_id, session_id)
+        await page.send("Page.enable")
+        return page
+
+    def _on_frame_navigated(self, params: dict):
+        frame = params.get("frame", {})
+        self._frames.clear()
+        if not frame.get("parentId"):
+            self.url = frame.get("url", self.url)
+            self._loaded.clear()
+            self._navigated.set()
+
+    async def send(self, method: str, params: Optional[dict] = None, timeout: float = 30) -> dict:
+        return await self.conn.send(method, params, self.session_id, timeout)
+
+    def log(self, msg: str, level: Optional[int] = None):
+        """В лог реплея, которому принадлежит вкладка (вне реплея — в лог процесса)."""
+        if self.logger is None:
+            log(msg, level)
+        else:
+            self.logger.log(level or level_of(msg), msg)
+
+    async def evaluate(self, expression: str, await_promise: bool = False, context_id: Optional[int] = None,
+                       timeout: float = 30, session_id: Optional[str] = None) -> Any:
+        params = {"expression": expression, "returnByValue": True, "awaitPromise": await_promise}
+        if context_id:
+            params["contextId"] = context_id
+        res = await self.conn.send("Runtime.evaluate", params, session_id or self.session_id, timeout)
+        if "exceptionDetails" in res:
+            raise CDPError(res["exceptionDetails"].get("text", "Runtime.evaluate failed"))
+        return res.get("result", {}).get("value")
+
+    async def wait_load(self, timeout: float = 10):
+        try:
+            await asyncio.wait_for(self._loaded.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.log("[WARN] load event timeout")
+
+    async def wait_settled(self, timeout: float = 10):
+        """Страница устоялась (src.settle) или, без детектора, пришёл load."""
+        if self.settler is None:
+            await self.wait_load(timeout)
+        elif not await self.settler.wait_async(self.conn, self.session_id, self.url):
+            self.log(f"[WARN] page did not settle: {self.url}")
+
+    async def navigate(self, url: str, timeout: float = 10):
+        self._loaded.clear()
+        res = await self.send("Page.navigate", {"url": url})
+        if res.get("errorText"):
+            self.log(f"[WARN] navigate {url}: {res['errorText']}")
+            return
+        if "loaderId" not in res:
+            return  # переход внутри документа (#hash) — load не будет
+        await self.wait_settled(timeout)
+
+    async def reload(self, timeout: float = 10):
+        self._loaded.clear()
+        await self.send("Page.reload")
+        await self.wait_load(timeout)
+
+    def expect_navigation(self):
+        """Вызывается перед действием, которое может увести страницу (см. after_action)."""
+        self._navigated.clear()
+
+    async def after_action(self, nav_timeout: float = 2.0, load_timeout: float = 10):
+        """Ждёт навигацию, начатую кликом (если она вообще случится), и пока страница устоится."""
+        try:
+            await asyncio.wait_for(self._navigated.wait(), nav_timeout)
+        except asyncio.TimeoutError:
+            return
+        await self.wait_settled(load_timeout)
+
+    async def _owner_offset(self, session_id: str, frame_id: str) -> Tuple[float, float]:
+        """Левый верхний угол <iframe> во вьюпорте документа сессии session_id."""
+        if session_id not in self._dom_sessions:
+            await self.conn.send("DOM.enable", None, session_id)
+            self._dom_sessions.add(session_id)
+        owner = await self.conn.send("DOM.getFrameOwner", {"frameId": frame_id}, session_id)
+        quad = (await self.conn.send("DOM.getBoxModel", {"backendNodeId": owner["backendNodeId"]},
+                                     session_id))["model"]["content"]
+        return quad[0], quad[1]
+
+    async def frame_context(self, chain: List[int]) -> Tuple[str, Optional[int], Tuple[float, float]]:
+        """
+        (сессия, executionContextId, смещение фрейма во вьюпорте) для цепочки индексов iframe.
+        Дочерние фреймы Page.getFrameTree идут в порядке документа, как
+        find_elements("iframe,frame") в replay_events. Out-of-process iframe (капчи
+        с другого сайта) живёт в своём target: мир создаётся в его сессии, а смещения
+        складываются по границам процессов. Кэш сбрасывается навигацией.
+        """
+        if not chain:
+            return self.session_id, None, (0.0, 0.0)
+        key = tuple(chain)
+        if key in self._frames:
+            return self._frames[key]
+        sid, base, offset = self.session_id, (0.0, 0.0), (0.0, 0.0)
+        node = (await self.send("Page.getFrameTree"))["frameTree"]
+        for idx in chain:
+            kids = node.get("childFrames", [])
+            if idx >= len(kids):
+                raise CDPError(f"iframe index {idx} not found")
+            node = kids[idx]
+            frame_id = node["frame"]["id"]
+            ox, oy = await self._owner_offset(sid, frame_id)
+            offset = (base[0] + ox, base[1] + oy)
+            child = self.frame_sessions.get(frame_id)
+            if child:
+                # координаты внутри OOPIF считаются от его собственного вьюпорта
+                sid, base = child, offset
+                node = (await self.conn.send("Page.getFrameTree", None, sid))["frameTree"]
+        try:
+            world = await self.conn.send("Page.createIsolatedWorld",
+                                         {"frameId": frame_id, "worldName": "replay"}, sid)
+        except CDPError as e:
+            raise CDPError(f"frame {list(chain)} ({frame_id}) is out-of-process and not attached: {e}")
+        self._frames[key] = (sid, world["executionContextId"], offset)
+        return self._frames[key]
+
+    async def locate(self, data: dict, payload: Optional[dict] = None, timeout: float = 2.0) -> Optional[dict]:
+        """Центр элемента (x, y во вьюпорте вкладки) и сработавшая стратегия, либо None."""
+        payload = payload or resolver_payload(data)
+        deadline = time.monotonic() + timeout
+        frame_error = None
+        while True:
+            left = max(0.0, deadline - time.monotonic())
+            try:
+                sid, ctx, (ox, oy) = await self.frame_context(data.get("frameChain", []))
+                hit = await self.evaluate(LOCATE_JS % (json.dumps(payload), int(left * 1000)),
+                                          await_promise=True, context_id=ctx, timeout=left + 5, session_id=sid)
+                frame_error = None
+                if hit:
+                    hit["x"] += ox
+                    hit["y"] += oy
+                    self.log(f"    resolved via {hit['strategy']}", DEBUG)
+                    if self.recorder:
+                        self.recorder.note(strategy=hit["strategy"])
+                    return hit
+            except CDPError as e:
+                # фрейма ещё нет / контекст уничтожен навигацией — пробуем заново
+                self._frames.clear()
+                frame_error = e
+            if time.monotonic() >= deadline:
+                if frame_error is not None:
+                    self.log(f"[WARN] frame not reachable: {frame_error}")
+                if self.recorder:
+                    self.recorder.note(outcome=UNRESOLVED)
+                return None
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        self.conn.off_session(self.session_id)
+        try:
+            await self.conn.send("Target.closeTarget", {"targetId": self.target_id})
+        except CDPError:
+            pass
+
+
+# ---------- replay ---------------------------------------------------------
+
+class AsyncReplay:
+    """Один реплей ExecutionPlan в собственном browser context."""
+
+    _tags = itertools.count(1)
+
+    def __init__(self, conn: CDPConnection, plan: ExecutionPlan, profile: ContextProfile,
+                 cookies: Optional[List[Dict[str, Any]]], pacer: AsyncPacer,
+                 proxy_check: bool = False, warmup: bool = False, blocker: Optional[ResourceBlocker] = None,
+                 assets: Optional[AssetTap] = None, settle: Optional[SettleBook] = None,
+                 instrument: Optional[StepRecorder] = None, artifacts: Optional[RunArtifacts] = None):
+        self.conn = conn
+        self.proxy_check = proxy_check
+        self.warmup = warmup
+        self.plan = plan
+        self.profile = profile
+        self.jar = CookieJar(cookies or [])
+        self.pacer = pacer
+        self.tag = f"cdp{next(self._tags)}"
+        self.step_no = 0
+        self.context_id = ""
+        self.pages: Dict[Any, Page] = {}
+        self.child_sessions: List[str] = []  # попапы и OOPIF, открытые самой страницей
+        self.frame_sessions: Dict[str, str] = {}  # frameId OOPIF → его сессия (для Page.frame_context)
+        self.tabs: Dict[Any, TabState] = defaultdict(TabState)
+        self.consent = ConsentDismisser()
+        self.blocker = blocker or ResourceBlocker()
+        self.assets = assets
+        self.settle = settle if settle is not None else SettleBook()
+        self.recorder = instrument if instrument is not None else StepRecorder()
+        self.recorder.bind(self.round_trips, lambda: self.pacer.total_slept)
+        self.artifacts = artifacts
+        self.logger = RunLogger(self.tag)
+        self.failure_handled = False  # run_step уже вывел буфер лога и сохранил артефакты
+
+    def log(self, msg: str, level: Optional[int] = None):
+        self.logger.step = self.step_no
+        self.logger.log(level or level_of(msg), msg)
+
+    def round_trips(self) -> int:
+        """Команды CDP вкладок и дочерних targets этого реплея."""
+        sids = [p.session_id for p in self.pages.values()] + self.child_sessions
+        return sum(self.conn.sent_by_session.get(sid, 0) for sid in sids)
+
+    async def run(self) -> Tuple[List[Dict[str, Any]], str]:
+        self.context_id = (await self.conn.send("Target.createBrowserContext",
+                                                self.profile.context_params()))["browserContextId"]
+        try:
+            await self.seed_cookies()
+            if self.proxy_check or self.warmup:
+                await self.preflight()
+            page = None
+            for step in self.plan.steps:
+                page = await self.run_step(step)
+
+            res = await self.conn.send("Storage.getCookies", {"browserContextId": self.context_id})
+            self.jar.observe(from_cdp_cookie(c) for c in res.get("cookies", []))
+            cookies = self.jar.to_list()
+            ua = self.profile.user_agent
+            if page is not None:
+                ua = await page.evaluate("navigator.userAgent") or ua
+            self.log(f"[PACING] {self.pacer.summary()}")
+            self.log(f"[CONSENT] {self.consent.summary()}")
+            self.log(f"[RESOURCES] {self.blocker.summary()}")
+            if self.assets:
+                self.log(f"[ASSETS] {self.assets.summary()}")
+            self.log(f"[SETTLE] {self.settle.summary()}")
+            self.log(f"[LOG] {self.logger.summary()}")
+            self.recorder.end()
+            return cookies, ua
+        except Exception as e:
+            if not self.failure_handled:
+                # падение вне обработчика шага: куки, preflight, открытие вкладки, капча
+                self.log(f"ERROR during replay: {type(e).__name__}: {e}")
+                self.recorder.note(outcome=ERROR)
+                self.recorder.end()
+                if self.pages:
+                    await self.save_failure(list(self.pages.values())[-1])
+                self.logger.dump("replay failed")
+            raise
+        finally:
+            self.logger.close()
+            for sid in [p.session_id for p in self.pages.values()] + self.child_sessions:
+                self.conn.off_session(sid)
+            try:
+                await self.conn.send("Target.disposeBrowserContext", {"browserContextId": self.context_id})
+            except CDPError:
+                pass
+
+    async def seed_cookies(self):
+        """Куки сессии — в контекст до первой навигации, все домены сразу; пакет не принят — по одной."""
+        batch = self.jar.pending()
+        if not batch:
+            return
+        try:
+            await self.conn.send("Storage.setCookies", {
+                "cookies": [to_cdp_cookie(c) for c in batch], "browserContextId": self.context_id})
+            self.jar.mark_sent(batch)
+            return
+        except CDPError as e:
+            self.log(f"[WARN] cookie batch rejected ({e}), setting {len(batch)} cookies one by one")
+        for ck in batch:
+            try:
+                await self.conn.send("Storage.setCookies", {
+                    "cookies": [to_cdp_cookie(ck)], "browserContextId": self.context_id})
+                self.jar.mark_sent([ck])
+            except CDPError as e:
+                self.jar.reject(ck)
+                self.log(f"[WARN] cookie {ck.get('name')} for {ck.get('domain')} rejected: {e}")
+
+    async def preflight(self):
+        """Необязательные навигации до реплея (как proxy_check / warmup в replay_events) во временной вкладке."""
+        probe = await Page.open(self.conn, self.context_id)
+        try:
+            await apply_emulation(self.conn, probe.session_id, self.profile)
+            await self.intercept(probe.session_id)
+            if self.proxy_check:
+                await probe.navigate("https://api.ipify.org?format=json")
+                self.log(f"[PROXY] {await probe.evaluate('document.body && document.body.innerText')}")
+            init_url = next(iter(self.plan.first_url.values()), None)
+            if self.warmup and init_url:
+                await probe.navigate(init_url)
+        finally:
+            await probe.close()
+
+    async def open_page(self, tab) -> Page:
+        page = await Page.open(self.conn, self.context_id)
+        await apply_emulation(self.conn, page.session_id, self.profile)
+        await self.consent.install_async(self.conn, page.session_id)
+        await self.intercept(page.session_id)
+        page.recorder = self.recorder
+        page.frame_sessions = self.frame_sessions
+        page.logger = self.logger
+        page.settler = PageSettler(self.settle)
+        await page.settler.install_async(self.conn, page.session_id)
+        self.watch_children(page.session_id)
+        self.pages[tab] = page
+
+        url0 = self.plan.first_url.get(tab)
+        if url0:
+            t0 = time.monotonic()
+            await page.navigate(url0)
+            self.pacer.spent("settle", time.monotonic() - t0)
+            st = self.tabs[tab]
+            st.last_user_ts = st.last_nav_ts = time.time()
+            st.last_url = url0
+        return page
+
+    async def intercept(self, session_id: str):
+        """Профиль ресурсов и общий кэш ассетов — один FetchRouter на target-сессию."""
+        router = FetchRouter(self.profile.proxy_auth)
+        await self.blocker.install_async(self.conn, session_id, router)
+        if self.assets:
+            self.assets.attach(router, self.blocker)
+        await router.install_async(self.conn, session_id)
+
+    def watch_children(self, session_id: str):
+        """
+        Дочерние targets (window.open, target=_blank, OOPIF) стартуют на паузе,
+        получают ту же эмуляцию и только потом продолжают загрузку.
+        """
+        def on_attached(params: dict):
+            asyncio.ensure_future(self._adopt_child(params))
+
+        self.conn.on("Target.attachedToTarget", on_attached, session_id)
+        asyncio.ensure_future(self.conn.send("Target.setAutoAttach", {
+            "autoAttach": True, "waitForDebuggerOnStart": True, "flatten": True}, session_id))
+
+    async def _adopt_child(self, params: dict):
+        sid = params["sessionId"]
+        self.child_sessions.append(sid)
+        try:
+            info = params.get("targetInfo", {})
+            kind = info.get("type")
+            if kind == "iframe":
+                # id target у OOPIF совпадает с frameId его фрейма в дереве родителя
+                self.frame_sessions[info.get("targetId")] = sid
+            if kind in ("page", "iframe"):
+                await apply_emulation(self.conn, sid, self.profile)
+                await self.consent.install_async(self.conn, sid)
+                await self.intercept(sid)
+                self.watch_children(sid)
+            elif kind in ("worker", "service_worker", "shared_worker") and self.profile.proxy_auth:
+                # запросы воркеров тоже идут через прокси и получают его 407
+                await self.intercept(sid)
+        except CDPError:
+            pass
+        finally:
+            try:
+                await self.conn.send("Runtime.runIfWaitingForDebugger", None, sid)
+            except CDPError:
+                pass
+
+    async def run_step(self, step: Step) -> Page:
+        self.recorder.begin(step.type)
+        page = self.pages.get(step.tab)
+        if page is not None:
+            await self.check_captcha(page)
+
+        self.step_no += 1
+        typ = step.type
+        self.logger.step = self.step_no
+        self.logger.event(typ, f"{typ:>12s} Δ={step.delta:>4} ms" + (f" (×{step.merged})" if step.merged > 1 else ""))
+        await self.pacer.gap(typ, step.delta)
+
+        if page is None:
+            page = await self.open_page(step.tab)
+
+        if typ in INTERACTIVE_TYPES:
+            self.tabs[step.tab].last_user_ts = time.time()
+
+        handler = getattr(self, "on_" + typ, None)
+        if handler is None:
+            return page
+        try:
+            await handler(page, step)
+        except Exception as e:
+            # не только ошибки CDP: таймауты ответов и закрытый websocket тоже оставляют артефакты
+            self.log(f"ERROR during {typ}: {type(e).__name__}: {e}")
+            self.recorder.note(outcome=ERROR)
+            self.recorder.end()
+            await self.save_failure(page)
+            self.logger.dump(f"{typ} failed")
+            self.failure_handled = True
+            raise
+        return page
+
+    # ---------- service ------------------------------------------------------
+
+    async def check_captcha(self, page: Page, pause_for: int = 60, poll_interval: int = 2) -> bool:
+        """Как check_captcha в replayer_new, но URL берётся из Page.frameNavigated, ожидание не блокирует loop."""
+        if not is_captcha_url(page.url):
+            return False
+        self.log(f"!!! CAPTCHA detected at {page.url}, waiting up to {pause_for}s for manual solve…")
+        start = time.time()
+        while time.time() - start < pause_for:
+            await asyncio.sleep(poll_interval)
+            if not is_captcha_url(page.url):
+                self.log(f"+++ CAPTCHA seems solved after {int(time.time() - start)}s, refreshing…")
+                break
+            self.log(f"    still captcha at {page.url}, waited {int(time.time() - start)}s…")
+        else:
+            self.log(f"!!! CAPTCHA still present after {pause_for}s, aborting")
+            raise RuntimeError("CAPTCHA page still detected after timeout")
+
+        await page.reload()
+        if is_captcha_url(page.url):
+            self.log(f"!!! CAPTCHA reappeared at {page.url}, aborting")
+            raise RuntimeError("CAPTCHA page still detected after refresh")
+        self.log(f"+++ CAPTCHA bypassed, continuing on {page.url}")
+        try:
+            await asyncio.sleep(0.3)
+            await page.send("Network.deleteCookies", {"name": "spravka", "url": page.url})
+        except CDPError:
+            pass
+        return True
+
+    async def save_failure(self, page: Page):
+        """Снимок, DOM и хвост лога реплея — в каталог прогона (src.artifacts), запись в фоне."""
+        try:
+            self.artifacts = self.artifacts or RunArtifacts("replay")
+            await self.artifacts.capture_async(self.conn, page.session_id, self.step_no, self.logger.tail())
+            self.log(f"[ARTIFACTS] {self.artifacts.dir}")
+        except Exception:
+            pass
+
+    async def click(self, page: Page, x: float, y: float):
+        await adispatch(page, click_events(x, y))
+
+    # ---------- navigation ---------------------------------------------------
+
+    async def on_navigate_intent(self, page: Page, step: Step):
+        data = step.data
+        href = data.get("href")
+        if not href or not data.get("was_recent_click"):
+            self.recorder.note(outcome=SKIPPED)
+            return
+        st = self.tabs[step.tab]
+        href_full = normalize_href(href, st.last_url)
+        if st.pending_url == href_full:
+            self.log(f"    >>> duplicate NAV intent to '{href_full}', skipped")
+            self.recorder.note(outcome=SKIPPED)
+            return
+        st.pending_url = href_full
+
+        page.expect_navigation()
+        method = "DIRECT"
+        # 1) клик по ссылке, 2) координатный клик, 3) прямой переход
+        hit = await page.locate(data, step.payload, timeout=0.6)
+        if hit:
+            await self.click(page, hit["x"], hit["y"])
+            method = "LINK"
+        elif data.get("boundingRect"):
+            bbox = data["boundingRect"]
+            await self.click(page, bbox["x"] + 3, bbox["y"] + 3)
+            method = "COORD"
+
+        if method == "DIRECT":
+            await page.navigate(href_full)
+        else:
+            await page.after_action()
+        self.log(f"    >>> NAV via {method}, landed on {page.url}")
+        self.recorder.note(strategy=method, outcome=OK)
+
+        await self.check_captcha(page)
+        st.last_url = page.url
+        st.pending_url = None
+        st.last_nav_ts = time.time()
+
+    async def on_completed_navigation(self, page: Page, step: Step):
+        now = time.time()
+        url_now = step.data.get("url", page.url)
+        st = self.tabs[step.tab]
+        if st.pending_url and url_now.startswith(st.pending_url):
+            st.pending_url = None
+            st.last_url = url_now
+            st.last_nav_ts = now
+            self.log(f"    >>> NAV accepted (pending): {url_now}")
+        elif now - st.last_user_ts >= 0.15 and now - st.last_nav_ts >= 0.30:
+            st.last_url = url_now
+            st.last_nav_ts = now
+            self.log(f"    >>> NAV accepted: {url_now}")
+        else:
+            self.log(f"    !!! NAV ignored:  {url_now}")
+            self.recorder.note(outcome=SKIPPED)
+
+    # ---------- actions ------------------------------------------------------
+
+    async def on_click(self, page: Page, step: Step):
+        hit = await page.locate(step.data, step.payload)
+        if hit:
+            await self.click(page, hit["x"], hit["y"])
+        else:
+            bbox = step.data.get("boundingRect", {})
+            await self.click(page, bbox.get("x", 0), bbox.get("y", 0))
+
+    async def on_keydown(self, page: Page, step: Step):
+        data = step.data
+        # фокус — кликом по элементу; не нашли — клавиши получит активный элемент
+        hit = await page.locate(data, step.payload, timeout=0.5)
+        if hit:
+            await self.click(page, hit["x"], hit["y"])
+
+        raw_key = data.get("key", "")
+        modifiers = sum(bit for flag, bit in MODIFIERS if data.get(flag))
+        if raw_key in SPECIAL_KEYS:
+            code, vk, text = SPECIAL_KEYS[raw_key]
+            key = " " if code == "Space" else raw_key
+        elif len(raw_key) == 1:
+            key, code, vk, text = raw_key, "", ord(raw_key.upper()), raw_key
+        else:
+            # непривычный key, просто игнорируем
+            self.recorder.note(outcome=SKIPPED)
+            return
+        if modifiers & (2 | 4):
+            text = ""  # сочетание, а не ввод символа
+        down = {"type": "keyDown" if text else "rawKeyDown", "key": key, "code": code,
+                "windowsVirtualKeyCode": vk, "modifiers": modifiers, "text": text}
+        up = {"type": "keyUp", "key": key, "code": code, "windowsVirtualKeyCode": vk, "modifiers": modifiers}
+        await page.send("Input.dispatchKeyEvent", down)
+        await page.send("Input.dispatchKeyEvent", up)
+        await self.pacer.sleep("keydown", max(0.01, data.get("delta", 50) / 1000))
+
+    async def on_scroll(self, page: Page, step: Step):
+        target_x = step.data.get("x", 0)
+        target_y = step.data.get("y", 0)
+        current_x, current_y = await page.evaluate("[window.scrollX, window.scrollY]")
+        steps = random.randint(5, 8)
+        dx = (target_x - current_x) / steps
+        dy = (target_y - current_y) / steps
+        for _ in range(steps):
+            await page.evaluate(f"window.scrollBy({dx}, {dy})")
+            await self.pacer.pause("scroll", 0.05, 0.2)
+        # небольшой «отскок» назад-вперёд
+        if random.random() < 0.3:
+            await page.evaluate(f"window.scrollBy({-dx / 3}, {-dy / 3})")
+            await self.pacer.sleep("scroll", 0.1)
+            await page.evaluate(f"window.scrollBy({dx / 3}, {dy / 3})")
+
+    async def on_wheel(self, page: Page, step: Step):
+        data = step.data
+        total = data.get("deltaY", data.get("y", 0))
+        log_dt = data.get("delta", abs(total)) / 1000.0
+        base = max(1, min(5, int(abs(total) / 100)))
+        parts = random.randint(max(1, base - 1), base + 1)
+        vw, vh = await page.evaluate("[window.innerWidth, window.innerHeight]")
+        moved = 0.0
+
+        for _ in range(parts):
+            portion = total / parts
+            dy = portion + random.uniform(-abs(portion) * 0.3, abs(portion) * 0.3)
+            moved += dy
+            if random.random() < 0.3:
+                await page.send("Input.dispatchMouseEvent", {
+                    "type": "mouseWheel", "x": random.randint(50, max(51, vw - 50)),
+                    "y": random.randint(50, max(51, vh - 50)), "deltaX": 0, "deltaY": dy, "pointerType": "mouse",
+                })
+            else:
+                await page.evaluate(f"window.scrollBy(0, {dy})")
+            # микроколебание курсора от центра
+            if random.random() < 0.4:
+                x = vw // 2 + random.randint(-5, 5)
+                y = vh // 2 + random.randint(-5, 5)
+                await adispatch(page, move_events([(0.0, x, y)]))
+
+        base_interval = log_dt / parts
+        interval = random.uniform(base_interval * 0.8, base_interval * 1.2)
+        await self.pacer.sleep("wheel", max(interval, 0.02))
+        remaining = total - moved
+        if abs(remaining) > 1:
+            await page.evaluate(f"window.scrollBy(0, {remaining})")
+            await self.pacer.pause("wheel", 0.05, 0.15)
+        await self.pacer.pause("wheel", 0.02, 0.05)
+
+    async def on_mouse_move(self, page: Page, step: Step):
+        pts = step.data.get("positions", [])
+        if pts:
+            kind = "mouse" if step.data.get("pointerType", "mouse") == "mouse" else "pen"
+            await adispatch(page, move_events(build_timeline(pts), kind))
+        await self.pacer.pause("mouse_move", 0.05, 0.15)
+
+    async def on_hover(self, page: Page, step: Step):
+        hit = await page.locate(step.data, step.payload, timeout=0.5)
+        if not hit:
+            self.log("hover skipped", DEBUG)
+            return
+        total = step.data.get("delta", 50) / 1000.0
+        timeline, dwell_time = hover_timeline(page, hit["x"], hit["y"], total)
+        await adispatch(page, move_events(timeline))
+        await self.pacer.sleep("hover", dwell_time)
+
+    on_hover_generic = on_hover
+
+    async def on_drag_sequence(self, page: Page, step: Step):
+        kind = "mouse" if step.data.get("pointerType", "mouse") == "mouse" else "pen"
+        await adispatch(page, drag_events(build_timeline(step.data.get("points", [])), kind))
+
+
+# ---------- engine ---------------------------------------------------------
+
+class CDPEngine:
+    """
+    Event loop в фоновом потоке + несколько общих Chrome. Реплеи из любых
+    потоков отправляются в loop (replay_sync), одновременно — не больше
+    max_sessions; контекстов на один Chrome — не больше contexts_per_browser.
+    """
+
+    def __init__(self, max_sessions: int, contexts_per_browser: int):
+        self.max_sessions = max_sessions
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="cdp-engine", daemon=True)
+        self._thread.start()
+        self._browsers: List[ChromeProcess] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def acquire_browser(self) -> ChromeProcess:
+        """Наименее загруженный живой Chrome со свободным местом под контекст, иначе новый."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            for chrome in [b for b in self._browsers if not b.alive]:
+                self._browsers.remove(chrome)
+                await chrome.stop()
+            free = [b for b in self._browsers if b.contexts < self.contexts_per_browser]
+            if free:
+                chrome = min(free, key=lambda b: b.contexts)
+            else:
+                chrome = ChromeProcess()
+                await chrome.start()
+                self._browsers.append(chrome)
+            chrome.contexts += 1
+            return chrome
+
+    async def release_browser(self, chrome: ChromeProcess):
+        async with self._lock:
+            chrome.contexts -= 1
+            # лишний пустой браузер закрываем, один оставляем прогретым
+            if chrome.contexts == 0 and len(self._browsers) > 1 and chrome in self._browsers:
+                self._browsers.remove(chrome)
+                await chrome.stop()
+
+    async def replay(self, plan: ExecutionPlan, user_agent: Optional[str] = None,
+                     cookies: Optional[List[Dict[str, Any]]] = None, proxy: Optional[str] = None,
+                     pacing: str | AsyncPacer = DEFAULT_POLICY, proxy_check: bool = False,
+                     warmup: bool = False, resource_policy: str | ResourceBlocker = DEFAULT_RESOURCE_POLICY,
+                     assets: Optional[AssetTap] = None,
+                     proxy_auth: Optional[Tuple[str, str]] = None,
+                     settle: Optional[SettleBook] = None,
+                     instrument: Optional[StepRecorder] = None,
+                     artifacts: Optional[RunArtifacts] = None) -> Tuple[List[Dict[str, Any]], str]:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_sessions)
+        pacer = pacing if isinstance(pacing, AsyncPacer) else AsyncPacer(pacing)
+        blocker = (resource_policy if isinstance(resource_policy, ResourceBlocker)
+                   else ResourceBlocker(resource_policy))
+        if not user_agent:
+            # как в replay_events: случайный UA под версию Chrome только при выходе через прокси
+            user_agent = (await asyncio.get_running_loop().run_in_executor(None, pick_chrome_ua)
+                          if proxy else settings.DEFAULT_UA)
+        profile = ContextProfile(user_agent=user_agent, proxy=proxy, proxy_auth=proxy_auth)
+        async with self._sem:
+            chrome = await self.acquire_browser()
+            try:
+                return await AsyncReplay(chrome.conn, plan, profile, cookies, pacer,
+                                         proxy_check=proxy_check, warmup=warmup, blocker=blocker,
+                                         assets=assets or open_tap(), settle=settle,
+                                         instrument=instrument, artifacts=artifacts).run()
+            finally:
+                await self.release_browser(chrome)
+
+    def replay_sync(self, events: List[Dict[str, Any]] | ExecutionPlan, skip_substrings=None,
+                    timeout: Optional[float] = None, **kwargs) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Блокирующая обёртка для задач Celery: тот же вход и выход, что у replay_events.
+        timeout — потолок всего реплея (по умолчанию CDP_ENGINE_REPLAY_TIMEOUT); по его
+        истечении корутина отменяется (контекст закрывается в её finally) и поднимается TimeoutError.
+        """
+        plan = events if isinstance(events, ExecutionPlan) else compile_plan(events, skip_substrings)
+        log(f"[PLAN] {plan.stats}")
+        fut = asyncio.run_coroutine_threadsafe(self.replay(plan, **kwargs), self.loop)
+        try:
+            return fut.result(timeout or settings.CDP_ENGINE_REPLAY_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise TimeoutError(f"CDP replay did not finish in {timeout or settings.CDP_ENGINE_REPLAY_TIMEOUT}s")
+
+    def shutdown(self):
+        async def _stop_all():
+            for chrome in list(self._browsers):
+                await chrome.stop()
+            self._browsers.clear()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_stop_all(), self.loop).result(30)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_engine: Optional[CDPEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_cdp_engine() -> CDPEngine:
+    """Движок создаётся при первом реплее с engine="cdp" и живёт до конца процесса воркера."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CDPEngine(settings.CDP_ENGINE_MAX_SESSIONS, settings.CDP_ENGINE_CONTEXTS_PER_BROWSER)
+        return _engine
+
+
+def shutdown_cdp_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+            _engine = None
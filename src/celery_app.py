@@ -30,6 +30,13 @@ celery_app.conf.update(
     #     'tasks.farm_cookie': {'queue': 'farm_queue'},
     #     'tasks.run_job':    {'queue': 'job_queue'},
     # }
+    # фоновая проверка прокси (нужен процесс celery beat)
+    beat_schedule={
+        'check-proxies': {
+            'task': 'check_proxies',
+            'schedule': float(settings.PROXY_CHECK_INTERVAL),
+        },
+    },
 )
 
 # Автоматически импортируем задачи из модуля tasks.py
@@ -22,6 +22,59 @@ class Settings(BaseSettings):
     REDIS_URL: Optional[str] = None
     RABBITMQ_URL: Optional[str] = None
     DEFAULT_UA: Optional[str] = None
+    # Пул прогретых Chrome на воркер (0 — отключить пул, браузер на каждую задачу)
+    BROWSER_POOL_SIZE: int = 1
+    # Через сколько аренд браузер из пула пересоздаётся
+    BROWSER_POOL_MAX_LEASES: int = 20
+    # Файл кэша версии Chrome (ключ — путь к бинарнику и его mtime)
+    BROWSER_CAPS_CACHE: str = ".cache/browser_caps.json"
+    # asyncio CDP-движок: сколько реплеев одновременно ведёт один процесс воркера
+    CDP_ENGINE_MAX_SESSIONS: int = 24
+    # Сколько изолированных browser context держит один Chrome движка (дальше — следующий Chrome)
+    CDP_ENGINE_CONTEXTS_PER_BROWSER: int = 12
+    # Запускать Chrome движка в headless-режиме
+    CDP_ENGINE_HEADLESS: bool = False
+    # Потолок одного реплея в движке, с: зависшая сессия не держит поток Celery бесконечно
+    CDP_ENGINE_REPLAY_TIMEOUT: float = 1800
+    # Домены через запятую, которые профиль ресурсов (resource_policy) никогда не блокирует
+    RESOURCE_ALLOW_DOMAINS: str = ""
+    # Общий для процессов хоста кэш статических ассетов (JS/CSS/шрифты), отдаётся через Fetch
+    ASSET_CACHE_DIR: str = ".cache/assets"
+    # Предел размера кэша ассетов, МБ (0 — кэш выключен: перехват ассетов тормозит каждый запрос)
+    ASSET_CACHE_MAX_MB: int = 0
+    # Фоновая проверка прокси (src.proxy_checker): период, параллельность, таймаут одной проверки, с
+    PROXY_CHECK_INTERVAL: int = 300
+    PROXY_CHECK_CONCURRENCY: int = 50
+    PROXY_CHECK_TIMEOUT: float = 10
+    # Прокси, проверенный не раньше стольких секунд назад, не проверяется в браузере перед реплеем
+    PROXY_FRESH_SECONDS: int = 900
+    # Сколько секунд локальный форвардер к апстриму живёт после последней задачи (src.forwarder)
+    FORWARDER_LINGER: float = 120
+    # Chrome ходит в http-прокси напрямую, логин/пароль — через CDP Fetch.authRequired (форвардер — запасной путь)
+    PROXY_DIRECT_AUTH: bool = True
+    # Страница устоялась, если сеть и DOM молчат столько мс (src.settle)
+    SETTLE_QUIET_MS: int = 500
+    # Потолок ожидания устаивания страницы, с (для незнакомых доменов — он же окно)
+    SETTLE_MAX_SECONDS: float = 8
+    # Домен «шумный», если таймаутов устаивания не меньше стольких и больше, чем удачных замеров:
+    # там ждём load документа + SETTLE_NOISY_PAUSE_MS вместо полного окна
+    SETTLE_NOISY_AFTER: int = 3
+    SETTLE_NOISY_PAUSE_MS: int = 1000
+    # Каталог для трассировки команд WebDriver реплея (src.tracing); пусто — выключено
+    REPLAY_TRACE_DIR: str = ""
+    # Артефакты упавших реплеев (src.artifacts): каталог, общий лимит, срок хранения, строк лога
+    ARTIFACTS_DIR: str = "replay_fails"
+    ARTIFACTS_MAX_MB: int = 500
+    ARTIFACTS_RETENTION_DAYS: float = 7
+    ARTIFACT_LOG_LINES: int = 200
+    # Лог реплея (src.replay_log): уровень вывода, каждая N-я строка частых событий,
+    # кольцевой буфер (целиком — при падении), пакет вывода в строках и секундах, формат text/json
+    REPLAY_LOG_LEVEL: str = "info"
+    REPLAY_LOG_SAMPLE: int = 20
+    REPLAY_LOG_BUFFER: int = 2000
+    REPLAY_LOG_FLUSH_LINES: int = 50
+    REPLAY_LOG_FLUSH_SECONDS: float = 2
+    REPLAY_LOG_FORMAT: str = "text"
 
     class Config:
         env_file = ".env"
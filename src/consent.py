@@ -0,0 +1,156 @@
+"""
+Закрытие баннеров согласия (куки, «Нет, спасибо») скриптом, внедрённым один раз.
+
+cookie_killer раз в 5 секунд делал querySelectorAll('[role=button],button,div'),
+разворачивал всех потомков каждого div и гонял regex по textContent — это
+квадратично по размеру DOM и подвешивает тяжёлые страницы на сотни мс.
+
+Здесь скрипт ставится через Page.addScriptToEvaluateOnNewDocument и смотрит
+только на добавленные узлы (MutationObserver): ищет в их поддереве селекторы
+правил и кликабельные элементы с коротким текстом. Правила — по сайтам
+(CONSENT_RULES, "*" — для всех). О каждом клике страница сообщает через
+Runtime.addBinding, ConsentDismisser считает закрытия по правилам.
+"""
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple
+
+BINDING = "__replayConsent"
+
+
+@dataclass(frozen=True)
+class ConsentRule:
+    name: str
+    selectors: Tuple[str, ...] = ()  # кликнуть элемент, подходящий под селектор
+    texts: Tuple[str, ...] = ()      # JS-regex (без учёта регистра) по тексту кнопки
+
+
+# ключ — домен сайта (поддомены подходят), "*" — правила для всех сайтов
+CONSENT_RULES: Dict[str, List[ConsentRule]] = {
+    "*": [
+        ConsentRule("accept", texts=(r"allow all|accept|принять|разрешить|согласен",)),
+        ConsentRule("no-thanks", texts=(r"нет[,\s]*спасибо",)),
+        ConsentRule("onetrust", selectors=("#onetrust-accept-btn-handler",)),
+        ConsentRule("cookiebot", selectors=("#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll",)),
+    ],
+    "google.com": [
+        ConsentRule("google-consent", selectors=("#L2AGLb", "button[aria-label='Accept all']")),
+    ],
+}
+
+CONSENT_JS = r"""
+(() => {
+  const KEY = Symbol.for("replay.consent");
+  if (window[KEY]) return;
+  Object.defineProperty(window, KEY, {value: true});
+
+  const BINDING = %(binding)s;
+  const report = typeof window[BINDING] === "function" ? window[BINDING] : null;
+  try { delete window[BINDING]; } catch (e) {}
+
+  const host = location.hostname;
+  const rules = %(rules)s
+    .filter(r => r.site === "*" || host === r.site || host.endsWith("." + r.site))
+    .map(r => ({name: r.name, selectors: r.selectors, re: r.texts.length ? new RegExp(r.texts.join("|"), "i") : null}));
+  if (!rules.length) return;
+
+  // без <a>: текстовое правило не должно уводить страницу по ссылке
+  const CLICKABLE = 'button,[role="button"],input[type="button"],input[type="submit"]';
+  const MAX_TEXT = 60, MAX_CLICKS = 10;
+  const clicked = new WeakSet();
+  let clicks = 0;
+
+  const click = (el, rule) => {
+    if (clicked.has(el) || clicks >= MAX_CLICKS) return;
+    clicked.add(el);
+    clicks++;
+    try { el.click(); } catch (e) {}
+    if (report) { try { report(JSON.stringify({rule: rule.name, host})); } catch (e) {} }
+  };
+
+  const within = (root, sel) => {
+    const found = root.matches && root.matches(sel) ? [root] : [];
+    return root.querySelectorAll ? found.concat([...root.querySelectorAll(sel)]) : found;
+  };
+
+  const scan = root => {
+    for (const rule of rules) {
+      for (const sel of rule.selectors) {
+        for (const el of within(root, sel)) click(el, rule);
+      }
+      if (!rule.re) continue;
+      for (const el of within(root, CLICKABLE)) {
+        const text = (el.textContent || el.value || "").trim();
+        if (text && text.length <= MAX_TEXT && rule.re.test(text)) click(el, rule);
+      }
+    }
+  };
+
+  // добавленные узлы копим и разбираем пачкой, не чаще раза в 50 мс
+  let queue = [], timer = null;
+  const flush = () => {
+    timer = null;
+    const batch = queue;
+    queue = [];
+    for (const node of batch) if (node.isConnected) scan(node);
+  };
+  new MutationObserver(records => {
+    if (clicks >= MAX_CLICKS) return;
+    for (const rec of records) {
+      for (const node of rec.addedNodes) if (node.nodeType === 1) queue.push(node);
+    }
+    if (queue.length && !timer) timer = setTimeout(flush, 50);
+  }).observe(document, {childList: true, subtree: true});
+
+  // внедрение в уже загруженный документ — один полный проход
+  if (document.readyState !== "loading" && document.documentElement) scan(document.documentElement);
+})();
+"""
+
+
+def build_consent_js(rules: Dict[str, List[ConsentRule]] = CONSENT_RULES) -> str:
+    flat = [{"site": site, **asdict(rule)} for site, site_rules in rules.items() for rule in site_rules]
+    return CONSENT_JS % {"binding": json.dumps(BINDING), "rules": json.dumps(flat, ensure_ascii=False)}
+
+
+class ConsentDismisser:
+    """Ставит скрипт во вкладки одного реплея и считает закрытые баннеры."""
+
+    def __init__(self, rules: Dict[str, List[ConsentRule]] = CONSENT_RULES):
+        self.source = build_consent_js(rules)
+        self.dismissed = 0
+        self.by_rule: Counter = Counter()
+
+    def _on_binding(self, params: dict):
+        if params.get("name") != BINDING:
+            return
+        try:
+            rule = json.loads(params.get("payload") or "{}").get("rule", "?")
+        except ValueError:
+            rule = "?"
+        self.dismissed += 1
+        self.by_rule[rule] += 1
+
+    def commands(self) -> List[tuple]:
+        # без Runtime.enable: сайты по нему узнают автоматизацию, а bindingCalled приходит и так
+        return [
+            ("Runtime.addBinding", {"name": BINDING}),
+            ("Page.addScriptToEvaluateOnNewDocument", {"source": self.source}),
+            # для документа, который уже открыт во вкладке
+            ("Runtime.evaluate", {"expression": self.source}),
+        ]
+
+    def install(self, cdp):
+        """cdp — канал вкладки (src.cdp.CDPChannel / DriverCDP; у последнего счётчик не работает)."""
+        cdp.on("Runtime.bindingCalled", self._on_binding)
+        cdp.send_batch(self.commands())
+
+    async def install_async(self, conn, session_id: str):
+        """То же для target-сессии asyncio-движка (src.cdp_engine)."""
+        conn.on("Runtime.bindingCalled", self._on_binding, session_id)
+        for method, params in self.commands():
+            await conn.send(method, params, session_id)
+
+    def summary(self) -> dict:
+        return {"dismissed": self.dismissed, "by_rule": dict(self.by_rule)}
@@ -0,0 +1,175 @@
+"""
+Банка кук реплея с индексом по домену.
+
+replay_events на каждом navigate_intent запрашивал driver.get_cookies(),
+линейно фильтровал все куки по host.endswith(domain), добавлял недостающие
+по одной через add_cookie, а после перехода пересобирал список через
+sum(_dup_ya_domains(...), []) + merge_cookies — квадратично по числу кук.
+
+Здесь:
+  • куки лежат в словаре по домену; поиск для хоста — обход его суффиксов
+    по меткам (a.b.ya.ru → b.ya.ru → ya.ru → ru), т.е. O(число меток);
+  • зеркалирование ya.ru ↔ yandex.ru делается при добавлении;
+  • банка помнит, какие куки браузер уже видел, и отдаёт только изменения
+    (pending), которые уходят в браузер одним Network.setCookies (flush).
+Ключ куки — (name, domain, path), как в прежнем merge_cookies.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CookieKey = Tuple[str, Optional[str], Optional[str]]
+
+# особенность яндекса: куки ya.ru и yandex.ru взаимозаменяемы
+YA_MIRRORS = (("ya.ru", ".yandex.ru"), ("yandex.ru", ".ya.ru"))
+
+
+def cookie_key(ck: Dict[str, Any]) -> CookieKey:
+    return ck["name"], ck.get("domain"), ck.get("path")
+
+
+def bare_domain(domain: Optional[str]) -> str:
+    return (domain or "").lstrip(".").lower()
+
+
+def ya_mirror(ck: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Копия куки для зеркального домена яндекса или None."""
+    d = bare_domain(ck.get("domain"))
+    for suffix, other in YA_MIRRORS:
+        if d == suffix or d.endswith("." + suffix):
+            return {**ck, "domain": other}
+    return None
+
+
+def host_suffixes(host: str) -> List[str]:
+    labels = (host or "").lower().split(".")
+    return [".".join(labels[i:]) for i in range(len(labels))]
+
+
+def to_cdp_cookie(ck: Dict[str, Any]) -> Dict[str, Any]:
+    """Кука в формате Selenium (как хранится в UserSession) → Network.CookieParam."""
+    out = {k: ck[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly") if k in ck}
+    if ck.get("sameSite") in ("Strict", "Lax", "None"):
+        out["sameSite"] = ck["sameSite"]
+    if ck.get("expiry") is not None:
+        out["expires"] = ck["expiry"]
+    return out
+
+
+def from_cdp_cookie(ck: Dict[str, Any]) -> Dict[str, Any]:
+    """Network.Cookie → формат Selenium (driver.get_cookies())."""
+    out = {k: ck[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly") if k in ck}
+    if ck.get("sameSite"):
+        out["sameSite"] = ck["sameSite"]
+    if not ck.get("session") and ck.get("expires", -1) > 0:
+        out["expiry"] = int(ck["expires"])
+    return out
+
+
+class CookieJar:
+    def __init__(self, cookies: Optional[Iterable[Dict[str, Any]]] = None):
+        self._cookies: Dict[CookieKey, Dict[str, Any]] = {}  # порядок вставки = порядок в to_list()
+        self._by_domain: Dict[str, Dict[CookieKey, Dict[str, Any]]] = {}
+        self._dirty: set = set()  # ключи, которых браузер ещё не видел в текущем виде
+        self.rejected: List[Dict[str, Any]] = []  # куки, которые браузер не принял (больше не отправляются)
+        for ck in cookies or ():
+            self.add(ck)
+
+    def __len__(self) -> int:
+        return len(self._cookies)
+
+    # ---------- запись -----------------------------------------------------
+
+    def _put(self, ck: Dict[str, Any], dirty: bool) -> bool:
+        key = cookie_key(ck)
+        old = self._cookies.get(key)
+        if old == ck:
+            if not dirty:
+                self._dirty.discard(key)
+            return False
+        self._cookies[key] = ck
+        self._by_domain.setdefault(bare_domain(ck.get("domain")), {})[key] = ck
+        if dirty:
+            self._dirty.add(key)
+        else:
+            self._dirty.discard(key)
+        return True
+
+    def add(self, ck: Dict[str, Any]) -> bool:
+        """Кука, которой ещё нет в браузере (из сохранённой сессии). True — если что-то изменилось."""
+        changed = self._put(ck, dirty=True)
+        mirror = ya_mirror(ck)
+        if mirror:
+            changed |= self._put(mirror, dirty=True)
+        return changed
+
+    def observe(self, cookies: Iterable[Dict[str, Any]]) -> int:
+        """
+        Куки, прочитанные из браузера: они там уже есть, поэтому не грязные.
+        Их зеркальные копии в браузере ещё не стоят — те помечаются к отправке.
+        Возвращает число изменённых записей.
+        """
+        changed = 0
+        for ck in cookies:
+            changed += self._put(ck, dirty=False)
+            mirror = ya_mirror(ck)
+            if mirror:
+                changed += self._put(mirror, dirty=True)
+        return changed
+
+    # ---------- чтение -----------------------------------------------------
+
+    def for_host(self, host: str) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for suffix in host_suffixes(host):
+            bucket = self._by_domain.get(suffix)
+            if bucket:
+                out.extend(bucket.values())
+        return out
+
+    def pending(self, host: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Куки, которые ещё надо отправить в браузер (все или только подходящие хосту)."""
+        if host is None:
+            return [self._cookies[k] for k in self._dirty]
+        return [ck for ck in self.for_host(host) if cookie_key(ck) in self._dirty]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self._cookies.values())
+
+    # ---------- применение ---------------------------------------------------
+
+    def mark_sent(self, batch: Iterable[Dict[str, Any]]):
+        for ck in batch:
+            self._dirty.discard(cookie_key(ck))
+
+    def reject(self, ck: Dict[str, Any]):
+        self._dirty.discard(cookie_key(ck))
+        self.rejected.append(ck)
+
+    def flush(self, send: Callable[[str, dict], Any], host: Optional[str] = None) -> int:
+        """
+        Отправляет накопленные изменения одним Network.setCookies через send
+        (cdp.send канала вкладки). Одна кука, которую Chrome не принимает (чужой
+        домен, префикс __Host-, SameSite), роняет весь пакет — тогда куки уходят по
+        одной через Network.setCookie, а отвергнутые снимаются с отправки и
+        попадают в rejected. Возвращает число принятых кук.
+        """
+        batch = self.pending(host)
+        if not batch:
+            return 0
+        try:
+            send("Network.setCookies", {"cookies": [to_cdp_cookie(c) for c in batch]})
+        except Exception:
+            sent = 0
+            for ck in batch:
+                try:
+                    res = send("Network.setCookie", to_cdp_cookie(ck))
+                    ok = not isinstance(res, dict) or res.get("success", True)
+                except Exception:
+                    ok = False
+                if ok:
+                    self._dirty.discard(cookie_key(ck))
+                    sent += 1
+                else:
+                    self.reject(ck)
+            return sent
+        self.mark_sent(batch)
+        return len(batch)
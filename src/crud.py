@@ -30,6 +30,43 @@ def list_proxies(db: Session) -> List[src.models.Proxy]:
     return db.query(src.models.Proxy).all()
 
 
+def _health_fields(res) -> dict:
+    if res.inconclusive:
+        # проверка упала в самом чекере: is_working и время проверки не трогаем
+        return {"check_error": res.error}
+    return {
+        "is_working": res.ok,
+        "last_checked": res.checked_at,
+        "connect_ms": res.connect_ms,
+        "tls_ms": res.tls_ms,
+        "exit_ip": res.exit_ip,
+        "check_error": res.error,
+    }
+
+
+def bulk_update_proxy_health(db: Session, results: List[tuple]) -> int:
+    """results — пары (proxy_id, ProbeResult) из src.proxy_checker; одно UPDATE-выполнение на все."""
+    rows = [{"id": proxy_id, **_health_fields(res)} for proxy_id, res in results]
+    if rows:
+        db.bulk_update_mappings(src.models.Proxy, rows)
+        db.commit()
+    return len(rows)
+
+
+def bulk_create_proxies(
+    db: Session,
+    proxies: List[src.schemas.ProxyCreate],
+    results: List[Any],
+) -> List[src.models.Proxy]:
+    """Импорт списка прокси сразу с результатами их проверки."""
+    objs = [src.models.Proxy(**p.dict(), **_health_fields(res)) for p, res in zip(proxies, results)]
+    db.add_all(objs)
+    db.commit()
+    for obj in objs:
+        db.refresh(obj)
+    return objs
+
+
 # --- FarmTask CRUD ---
 
 def create_farm_task(
@@ -47,7 +84,8 @@ def create_farm_task(
     task = FarmTask(
         instruction_set_id=instr_set.id,
         assigned_proxy_id=proxy_id,
-        base_session_id=farm_in.base_session_id
+        base_session_id=farm_in.base_session_id,
+        resource_policy=farm_in.resource_policy,
     )
     db.add(task)
     db.commit()
@@ -134,7 +172,8 @@ def create_job_task(
 
     jt = JobTask(
         session_id=session_id,
-        instruction_set_id=instr_set.id
+        instruction_set_id=instr_set.id,
+        resource_policy=job_in.resource_policy,
     )
     db.add(jt)
     db.commit()
@@ -198,6 +237,33 @@ def create_job_report(
 def get_reports_by_job(db: Session, job_id: int) -> List[src.models.JobReport]:
     return db.query(src.models.JobReport).filter(src.models.JobReport.job_task_id == job_id).all()
 
+
+# --- FarmReport CRUD ---
+
+def create_farm_report(
+    db: Session,
+    farm_task: FarmTask,
+    user_session_id: Optional[int] = None,
+    result_text: Optional[str] = None,
+    report_metadata: Any = None,
+    error: Optional[str] = None
+) -> src.models.FarmReport:
+    fr = src.models.FarmReport(
+        farm_task_id=farm_task.id,
+        user_session_id=user_session_id,
+        result_text=result_text,
+        report_metadata=report_metadata,
+        error=error
+    )
+    db.add(fr)
+    db.commit()
+    db.refresh(fr)
+    return fr
+
+
+def get_reports_by_farm(db: Session, farm_id: int) -> List[src.models.FarmReport]:
+    return db.query(src.models.FarmReport).filter(src.models.FarmReport.farm_task_id == farm_id).all()
+
 # --- InstructionSet CRUD ---
 def create_instruction_set(
     db: Session,
@@ -240,3 +306,20 @@ def update_user_session(
     db.commit()
     db.refresh(session)
     return session
+
+
+# --- DomainSettleStat CRUD ---
+
+def list_settle_stats(db: Session) -> List[src.models.DomainSettleStat]:
+    return db.query(src.models.DomainSettleStat).all()
+
+
+def save_settle_stats(db: Session, updates: List[tuple]) -> int:
+    """updates — пары (домен, src.settle.DomainSettle) из SettleBook.updates(); вставка или замена."""
+    now = datetime.utcnow()
+    for domain, st in updates:
+        db.merge(src.models.DomainSettleStat(domain=domain, samples=st.samples, avg_ms=st.avg_ms,
+                                             timeouts=st.timeouts, updated_at=now))
+    if updates:
+        db.commit()
+    return len(updates)
@@ -0,0 +1,141 @@
+"""
+Поиск элемента одним execute_script.
+
+Каскад стратегий (selector → aria-label → role → id → name → комбинированный
+селектор → <a href> точный/по домену → <a> по тексту) раньше шёл отдельными
+find_element-вызовами, т.е. отдельным HTTP-запросом к chromedriver на каждую
+попытку. Здесь весь каскад выполняется в странице, наружу возвращается
+[element, strategy] или null.
+"""
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+RESOLVER_JS = r"""
+const p = arguments[0];
+let ctx = document;
+for (const sel of p.shadowPath || []) {
+  const host = ctx.querySelector(sel);
+  if (!host || !host.shadowRoot) return null;
+  ctx = host.shadowRoot;
+}
+const q = s => { try { return ctx.querySelector(s); } catch (e) { return null; } };
+const attr = (name, value, tag = "") => q(`${tag}[${name}="${CSS.escape(value)}"]`);
+const tries = [
+  ["selector",   () => p.selector && q(p.selector)],
+  ["aria-label", () => p.ariaLabel && attr("aria-label", p.ariaLabel)],
+  ["role",       () => p.role && attr("role", p.role)],
+  ["id",         () => p.id && attr("id", p.id)],
+  ["name",       () => p.name && attr("name", p.name)],
+  ["combined",   () => p.combined && q(p.combined)],
+  // только <a>: [href] без тега находит <link rel=canonical> / <base> в <head> раньше ссылки
+  ["href",       () => p.href && (attr("href", p.href, "a") || attr("href", p.href.replace(/\/+$/, ""), "a"))],
+  ["href-netloc",() => p.netloc && q(`a[href*="${CSS.escape(p.netloc)}"]`)],
+  ["text",       () => {
+      if (!p.snippet) return null;
+      const needle = p.snippet.toLowerCase();
+      for (const a of ctx.querySelectorAll("a")) {
+        if ((a.innerText || "").toLowerCase().includes(needle)) return a;
+      }
+      return null;
+  }],
+];
+for (const [strategy, fn] of tries) {
+  const el = fn();
+  if (el) return [el, strategy];
+}
+return null;
+"""
+
+
+# Ожидание элемента без поллинга из Python: проверяем сразу, затем на каждую пачку
+# DOM-мутаций (не чаще раза в кадр). MutationObserver на документе не видит
+# изменения внутри shadow DOM, поэтому есть редкий страховочный опрос.
+WAIT_JS = "const __resolve = function() {" + RESOLVER_JS + "};\n" + r"""
+const p = arguments[0], timeoutMs = arguments[1], done = arguments[arguments.length - 1];
+let finished = false, scheduled = false, observer = null, timer = null, poll = null;
+const finish = res => {
+  if (finished) return;
+  finished = true;
+  if (observer) observer.disconnect();
+  clearTimeout(timer);
+  clearInterval(poll);
+  done(res);
+};
+const check = () => {
+  let res = null;
+  try { res = __resolve(p); } catch (e) {}
+  if (res) finish(res);
+};
+check();
+if (!finished) {
+  observer = new MutationObserver(() => {
+    if (scheduled || finished) return;
+    scheduled = true;
+    setTimeout(() => { scheduled = false; check(); }, 16);
+  });
+  observer.observe(document.documentElement || document, {
+    childList: true, subtree: true, attributes: true,
+    attributeFilter: ["id", "class", "name", "href", "role", "aria-label"],
+  });
+  poll = setInterval(check, 250);
+  timer = setTimeout(() => finish(null), timeoutMs);
+}
+"""
+
+
+def build_combined_selector(data: Dict[str, Any]) -> Optional[str]:
+    parts, tag = [], data.get("tag")
+    if tag:
+        parts.append(tag)
+    if data.get("id"):
+        return (tag or "") + f"#{data['id']}"
+    parts.extend("." + cls for cls in data.get("classList", []))
+    if data.get("name"):
+        parts.append(f"[name='{data['name']}']")
+    if data.get("placeholder"):
+        parts.append(f"[placeholder='{data['placeholder']}']")
+    if data.get("type"):
+        parts.append(f"[type='{data['type']}']")
+    return "".join(parts) or None
+
+
+def resolver_payload(data: Dict[str, Any], with_links: bool = True) -> Dict[str, Any]:
+    """Аргумент для RESOLVER_JS; with_links=False — только атрибутные стратегии (без href/текста)."""
+    aria = data.get("aria") or {}
+    href = data.get("href") if with_links else None
+    return {
+        "shadowPath": data.get("shadowPath", []),
+        "selector": data.get("selector"),
+        "ariaLabel": aria.get("label"),
+        "role": aria.get("role"),
+        "id": data.get("id"),
+        "name": data.get("name"),
+        "combined": build_combined_selector(data),
+        "href": href,
+        "netloc": urlparse(href).netloc if href else None,
+        "snippet": (data.get("text") or "").strip()[:80] if with_links else "",
+    }
+
+
+def resolve_in_page(driver, payload: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+    """Один round trip: (WebElement, стратегия) или (None, None) в текущем фрейме."""
+    res = driver.execute_script(RESOLVER_JS, payload)
+    if not res:
+        return None, None
+    return res[0], res[1]
+
+
+def wait_in_page(driver, payload: Dict[str, Any], timeout: float) -> Tuple[Any, Optional[str]]:
+    """
+    Ждёт появления элемента в текущем фрейме через execute_async_script + MutationObserver.
+    Возвращается сразу, как только узел подходит под каскад, либо (None, None) по timeout.
+    script timeout драйвера должен быть больше timeout (см. SCRIPT_TIMEOUT).
+    """
+    res = driver.execute_async_script(WAIT_JS, payload, int(timeout * 1000))
+    if not res:
+        return None, None
+    return res[0], res[1]
+
+
+# script timeout, который реплеер выставляет драйверу: с запасом больше любых ожиданий элементов
+SCRIPT_TIMEOUT = 30
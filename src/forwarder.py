@@ -0,0 +1,397 @@
+"""
+Пул локальных форвардеров к апстрим-прокси внутри процесса воркера.
+
+Chrome не умеет --proxy-server с user:pass, поэтому между ним и апстримом
+стоит локальный форвардер. start_local_proxy запускал на каждую задачу новый
+subprocess proxy.py, ждал фиксированные 0.5 с и полагался на atexit, который в
+долгоживущем воркере Celery не срабатывает, — форвардеры копились.
+
+Здесь форвардер — asyncio-сервер в фоновом потоке процесса, один на апстрим:
+  • acquire(upstream) возвращает "127.0.0.1:<port>" только после проверки
+    готовности (тестовое соединение к порту), без слепого sleep;
+  • на апстрим держатся заранее открытые TCP-соединения (SPARE_CONNECTIONS),
+    CONNECT-туннель не ждёт установки соединения; HTTP-соединение браузера
+    привязано к одному апстрим-соединению и живёт, пока живо keep-alive;
+  • ссылки считаются: после последнего release форвардер ещё FORWARDER_LINGER
+    секунд ждёт следующую задачу и только потом закрывается. Порт при
+    повторном запуске тот же — прогретые браузеры пула с этим --proxy-server
+    остаются пригодны;
+  • метрики по апстриму: соединения, туннели, запросы, байты, латентность
+    соединения с апстримом, ошибки (metrics()).
+
+Апстрим — http(s)://[user:pass@]host:port или socks5://... (у SOCKS5 — только
+CONNECT, то есть HTTPS; обычный HTTP через него получает 502).
+
+Форвардер — запасной путь: chrome_route говорит, когда Chrome может ходить в
+апстрим сам (логин и пароль отдаёт Fetch.authRequired, см. src.interception).
+"""
+import asyncio
+import base64
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from src.config import settings
+from src.proxy_checker import ProxySpec, socks5_connect
+
+SPARE_CONNECTIONS = 2
+SPARE_TTL = 30.0        # сколько держим неиспользованное соединение к апстриму, с
+
+
+@dataclass
+class Upstream:
+    scheme: str
+    host: str
+    port: int
+    login: Optional[str] = None
+    password: Optional[str] = None
+
+    @classmethod
+    def parse(cls, url: str) -> "Upstream":
+        if "://" not in url:
+            url = "http://" + url
+        u = urlsplit(url)
+        return cls(u.scheme.lower(), u.hostname, u.port or 8080,
+                   unquote(u.username) if u.username else None, unquote(u.password) if u.password else None)
+
+    @property
+    def socks(self) -> bool:
+        return self.scheme.startswith("socks")
+
+    def auth_header(self) -> Optional[bytes]:
+        if not self.login:
+            return None
+        token = base64.b64encode(f"{self.login}:{self.password or ''}".encode()).decode()
+        return f"Proxy-Authorization: Basic {token}\r\n".encode()
+
+    def spec(self) -> ProxySpec:
+        return ProxySpec(self.host, self.port, self.scheme, self.login, self.password)
+
+
+@dataclass
+class ForwarderMetrics:
+    connections: int = 0       # соединений от браузера
+    active: int = 0
+    tunnels: int = 0           # CONNECT
+    http_requests: int = 0     # обычный HTTP (absolute-URI)
+    bytes_up: int = 0
+    bytes_down: int = 0
+    upstream_connects: int = 0
+    upstream_connect_ms: float = 0.0
+    spare_hits: int = 0        # соединение к апстриму взято готовым
+    errors: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    def as_dict(self) -> dict:
+        d = dict(self.__dict__)
+        d["avg_upstream_connect_ms"] = (round(self.upstream_connect_ms / self.upstream_connects, 1)
+                                        if self.upstream_connects else None)
+        d["upstream_connect_ms"] = round(self.upstream_connect_ms, 1)
+        return d
+
+
+def _strip_auth(head: bytes) -> bytes:
+    """Убирает из заголовков браузера Proxy-Authorization / Proxy-Connection — их ставит форвардер."""
+    lines = head.split(b"\r\n")
+    kept = [l for l in lines[1:] if not l.lower().startswith((b"proxy-authorization:", b"proxy-connection:"))]
+    return b"\r\n".join([lines[0]] + kept)
+
+
+def _content_length(head: bytes) -> int:
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return int(value.strip())
+            except ValueError:
+                return 0
+    return 0
+
+
+class Forwarder:
+    def __init__(self, upstream: Upstream):
+        self.upstream = upstream
+        self.metrics = ForwarderMetrics()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+        self.refs = 0
+        self._close_handle: Optional[asyncio.TimerHandle] = None
+        self._spare: Deque[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = deque()
+        self._refilling = False
+
+    # ---------- жизненный цикл -------------------------------------------
+
+    async def start(self, port: int = 0):
+        handler = self._handle
+        try:
+            self.server = await asyncio.start_server(handler, "127.0.0.1", port)
+        except OSError:
+            self.server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        await self.ready()
+        self._refill()
+
+    async def ready(self, timeout: float = 5.0):
+        """Проба готовности: к порту форвардера реально подключаемся."""
+        _, w = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", self.port), timeout)
+        w.close()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        while self._spare:
+            self._spare.popleft()[1].close()
+
+    # ---------- соединения к апстриму --------------------------------------
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        t0 = time.perf_counter()
+        conn = await asyncio.wait_for(asyncio.open_connection(self.upstream.host, self.upstream.port),
+                                      settings.PROXY_CHECK_TIMEOUT)
+        self.metrics.upstream_connects += 1
+        self.metrics.upstream_connect_ms += (time.perf_counter() - t0) * 1000
+        return conn
+
+    async def _take(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        now = time.time()
+        conn = None
+        while self._spare:
+            r, w, ts = self._spare.popleft()
+            if now - ts < SPARE_TTL and not r.at_eof() and not w.is_closing():
+                self.metrics.spare_hits += 1
+                conn = (r, w)
+                break
+            w.close()
+        self._refill()
+        return conn or await self._connect()
+
+    def _refill(self):
+        if self._refilling or self.server is None:
+            return
+        self._refilling = True
+
+        async def fill():
+            try:
+                while len(self._spare) < SPARE_CONNECTIONS and self.refs > 0:
+                    r, w = await self._connect()
+                    self._spare.append((r, w, time.time()))
+            except Exception:
+                self.metrics.errors += 1
+            finally:
+                self._refilling = False
+
+        asyncio.ensure_future(fill())
+
+    # ---------- обработка браузера -----------------------------------------
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, up: bool):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                if up:
+                    self.metrics.bytes_up += len(data)
+                else:
+                    self.metrics.bytes_down += len(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_r: asyncio.StreamReader, client_w: asyncio.StreamWriter):
+        self.metrics.connections += 1
+        self.metrics.active += 1
+        up_w = None
+        try:
+            try:
+                head = await client_r.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return  # проба готовности или оборванное соединение
+            method, target = head.split(b" ", 2)[:2]
+            if method.upper() == b"CONNECT":
+                up_w = await self._tunnel(client_r, client_w, target.decode())
+            else:
+                up_w = await self._http(client_r, client_w, head)
+        except Exception:
+            self.metrics.errors += 1
+            try:
+                client_w.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            except Exception:
+                pass
+        finally:
+            self.metrics.active -= 1
+            client_w.close()
+            if up_w is not None:
+                up_w.close()
+
+    async def _tunnel(self, client_r, client_w, target: str):
+        self.metrics.tunnels += 1
+        host, _, port = target.rpartition(":")
+        up_r, up_w = await self._take()
+        if self.upstream.socks:
+            await socks5_connect(up_r, up_w, self.upstream.spec(), host.strip("[]"), int(port))
+            client_w.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        else:
+            req = f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n".encode()
+            up_w.write(req + (self.upstream.auth_header() or b"") + b"\r\n")
+            await up_w.drain()
+            resp = await up_r.readuntil(b"\r\n\r\n")
+            client_w.write(resp)  # ответ апстрима как есть (200 или его ошибка)
+            if b" 200" not in resp.split(b"\r\n", 1)[0]:
+                return up_w
+        await client_w.drain()
+        await asyncio.gather(self._pipe(client_r, up_w, True), self._pipe(up_r, client_w, False))
+        return up_w
+
+    async def _http(self, client_r, client_w, head: bytes):
+        if self.upstream.socks:
+            raise ConnectionError("plain HTTP is not supported over a SOCKS upstream")
+        up_r, up_w = await self._take()
+        down = asyncio.ensure_future(self._pipe(up_r, client_w, False))
+        auth = self.upstream.auth_header() or b""
+        try:
+            # запросы одного keep-alive соединения браузера идут в одно соединение апстрима
+            while head:
+                self.metrics.http_requests += 1
+                body_len = _content_length(head)
+                out = _strip_auth(head[:-4]) + b"\r\n" + auth + b"\r\n"
+                if body_len:
+                    out += await client_r.readexactly(body_len)
+                up_w.write(out)
+                self.metrics.bytes_up += len(out)
+                await up_w.drain()
+                try:
+                    head = await client_r.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    head = b""
+        finally:
+            # браузер закрыл соединение — ответы ему больше не нужны
+            down.cancel()
+        return up_w
+
+
+class ForwarderPool:
+    """Форвардеры процесса по апстримам; asyncio-loop — в фоновом потоке."""
+
+    def __init__(self, linger: float):
+        self.linger = linger
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="forwarders", daemon=True)
+        self._thread.start()
+        self._forwarders: Dict[str, Forwarder] = {}
+        self._ports: Dict[str, int] = {}  # последний порт апстрима — чтобы --proxy-server браузеров пула не менялся
+
+    def _run(self, coro, timeout: float = 15):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _acquire(self, upstream: str) -> str:
+        fw = self._forwarders.get(upstream)
+        if fw is None:
+            fw = self._forwarders[upstream] = Forwarder(Upstream.parse(upstream))
+            fw.refs += 1
+            try:
+                await fw.start(self._ports.get(upstream, 0))
+            except Exception:
+                del self._forwarders[upstream]
+                raise
+            self._ports[upstream] = fw.port
+        else:
+            fw.refs += 1
+            if fw._close_handle:
+                fw._close_handle.cancel()
+                fw._close_handle = None
+        return f"127.0.0.1:{fw.port}"
+
+    async def _release(self, upstream: str):
+        fw = self._forwarders.get(upstream)
+        if fw is None:
+            return
+        fw.refs -= 1
+        if fw.refs <= 0 and fw._close_handle is None:
+            fw._close_handle = self.loop.call_later(
+                self.linger, lambda: asyncio.ensure_future(self._close_idle(upstream)))
+
+    async def _close_idle(self, upstream: str):
+        fw = self._forwarders.get(upstream)
+        if fw is not None and fw.refs <= 0:
+            del self._forwarders[upstream]
+            await fw.stop()
+
+    def acquire(self, upstream: str) -> str:
+        """Адрес готового форвардера к upstream ("127.0.0.1:<port>"); парный release обязателен."""
+        return self._run(self._acquire(upstream))
+
+    def release(self, upstream: str):
+        self._run(self._release(upstream))
+
+    @contextmanager
+    def leased(self, upstream: str):
+        local = self.acquire(upstream)
+        try:
+            yield local
+        finally:
+            self.release(upstream)
+
+    def metrics(self) -> Dict[str, dict]:
+        """Метрики по апстримам (без логина и пароля в ключе)."""
+        async def collect():
+            out = {}
+            for fw in self._forwarders.values():
+                u = fw.upstream
+                out[f"{u.scheme}://{u.host}:{u.port}"] = {**fw.metrics.as_dict(), "refs": fw.refs, "port": fw.port}
+            return out
+        return self._run(collect())
+
+    def shutdown(self):
+        async def _stop_all():
+            for fw in list(self._forwarders.values()):
+                await fw.stop()
+            self._forwarders.clear()
+
+        try:
+            self._run(_stop_all(), 30)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def chrome_route(upstream: str) -> Optional[Tuple[str, Optional[Tuple[str, str]]]]:
+    """
+    (--proxy-server для Chrome, (логин, пароль) или None), если браузер может
+    подключиться к апстриму напрямую; None — нужен локальный форвардер.
+    SOCKS5 с паролем Chrome не поддерживает, http(s) — через Fetch.authRequired.
+    """
+    if not settings.PROXY_DIRECT_AUTH:
+        return None
+    u = Upstream.parse(upstream)
+    if u.socks:
+        return (f"socks5://{u.host}:{u.port}", None) if not u.login else None
+    return f"{u.host}:{u.port}", ((u.login, u.password or "") if u.login else None)
+
+
+_pool: Optional[ForwarderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_forwarder_pool() -> ForwarderPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ForwarderPool(settings.FORWARDER_LINGER)
+        return _pool
+
+
+def shutdown_forwarder_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
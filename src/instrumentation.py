@@ -0,0 +1,114 @@
+"""
+Профиль реплея по шагам: время, сон, обращения к браузеру, стратегия, исход.
+
+Раньше о прогоне оставались только строки log() и result_text="OK".
+StepRecorder держит в памяти по кортежу на шаг ExecutionPlan:
+  wall_ms     — от начала шага до начала следующего (или конца реплея);
+  sleep_ms    — сколько из них проспал Pacer (паузы и ожидания страницы);
+  round_trips — команд WebDriver и CDP, отправленных за шаг;
+  strategy    — чем найден элемент (стратегия резолвера; для navigate_intent — LINK/COORD/DIRECT);
+  outcome     — ok / skipped / unresolved / error.
+Шаг закрывается началом следующего, поэтому continue в цикле реплея ничего
+не ломает. profile() сворачивает записи в p50/p95 по типам событий — это
+уходит в report_metadata отчётов (JobReport, FarmReport).
+"""
+import math
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+OK, SKIPPED, UNRESOLVED, ERROR = "ok", "skipped", "unresolved", "error"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Ближайший ранг по уже отсортированному списку."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1]
+
+
+class StepRecorder:
+    def __init__(self):
+        self.round_trips: Callable[[], int] = lambda: 0
+        self.slept: Callable[[], float] = lambda: 0.0
+        self.records: List[tuple] = []  # (type, wall_ms, sleep_ms, round_trips, strategy, outcome)
+        self._open: Optional[list] = None
+        self._started = time.perf_counter()
+
+    def bind(self, round_trips: Callable[[], int], slept: Callable[[], float]):
+        """Счётчики реплея (нарастающие): отправленные команды и секунды сна Pacer. Зовёт сам реплей."""
+        self.round_trips = round_trips
+        self.slept = slept
+        self._started = time.perf_counter()
+
+    def begin(self, typ: str):
+        self.end()
+        self._open = [typ, time.perf_counter(), self.slept(), self.round_trips(), None, OK]
+
+    def note(self, strategy: Optional[str] = None, outcome: Optional[str] = None):
+        if self._open is None:
+            return
+        if strategy is not None:
+            self._open[4] = strategy
+        if outcome is not None:
+            self._open[5] = outcome
+
+    def end(self):
+        if self._open is None:
+            return
+        typ, t0, slept0, trips0, strategy, outcome = self._open
+        self._open = None
+        self.records.append((
+            typ, (time.perf_counter() - t0) * 1000, (self.slept() - slept0) * 1000,
+            max(0, self.round_trips() - trips0), strategy, outcome,
+        ))
+
+    def profile(self, waits: Optional[Dict[str, float]] = None) -> dict:
+        """Сводка реплея; waits — Pacer.summary()["by_kind"], на что ушёл сон."""
+        self.end()
+        by_type: Dict[str, dict] = {}
+        walls: Dict[str, List[float]] = {}
+        for typ, wall, sleep, trips, strategy, outcome in self.records:
+            agg = by_type.setdefault(typ, {"count": 0, "sleep_ms": 0.0, "round_trips": 0,
+                                           "outcomes": Counter(), "strategies": Counter()})
+            agg["count"] += 1
+            agg["sleep_ms"] += sleep
+            agg["round_trips"] += trips
+            agg["outcomes"][outcome] += 1
+            if strategy:
+                agg["strategies"][strategy] += 1
+            walls.setdefault(typ, []).append(wall)
+        for typ, agg in by_type.items():
+            values = sorted(walls[typ])
+            agg.update(p50_ms=round(percentile(values, 0.5), 1), p95_ms=round(percentile(values, 0.95), 1),
+                       sleep_ms=round(agg["sleep_ms"], 1), outcomes=dict(agg["outcomes"]),
+                       strategies=dict(agg["strategies"]))
+        return {
+            "steps": len(self.records),
+            "wall_s": round(time.perf_counter() - self._started, 3),
+            "steps_wall_s": round(sum(r[1] for r in self.records) / 1000, 3),
+            "slept_s": round(sum(r[2] for r in self.records) / 1000, 3),
+            "round_trips": sum(r[3] for r in self.records),
+            "waits": waits or {},
+            "errors": sum(r[5] == ERROR for r in self.records),
+            "by_type": by_type,
+        }
+
+
+def count_webdriver_commands(driver) -> Callable[[], int]:
+    """
+    Счётчик команд WebDriver (каждая — HTTP-запрос к chromedriver): driver.execute
+    оборачивается один раз на драйвер, обёртка остаётся и для следующих реплеев пула.
+    """
+    counter = getattr(driver, "_replay_commands", None)
+    if counter is None:
+        counter = driver._replay_commands = [0]
+        execute = driver.execute
+
+        def counted(*args, **kwargs):
+            counter[0] += 1
+            return execute(*args, **kwargs)
+
+        driver.execute = counted
+    start = counter[0]
+    return lambda: counter[0] - start
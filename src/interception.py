@@ -0,0 +1,349 @@
+"""
+Профиль загрузки ресурсов реплея (resource_policy задачи) через Fetch-перехват.
+
+Фарму нужны куки и реалистичная навигация, а каждая картинка, шрифт, видео и
+маяк аналитики качались через апстрим-прокси, который оплачивается за ГБ.
+
+  full     — грузится всё, перехвата нет (как раньше);
+  no-media — не грузятся Image / Media / Font;
+  minimal  — плюс ping, prefetch, manifest, субтитры и сторонняя аналитика.
+
+Fetch.enable ставится только с шаблонами блокируемых типов и доменов, поэтому
+документы, XHR и скрипты Chrome не останавливает. Домены из allow-list
+(капчи и антибот-проверки, + RESOURCE_ALLOW_DOMAINS) пропускаются всегда.
+Байты пропущенных ответов считаются по Network.loadingFinished; у
+заблокированных запросов тела нет вовсе — для них считается число запросов.
+
+Если у вкладки нет канала с событиями (DriverCDP), профиль ставится через
+Network.setBlockedURLs по маскам расширений — без allow-list и учёта.
+
+FetchRouter с proxy_auth ещё и отвечает на Fetch.authRequired прокси — так Chrome
+ходит в апстрим с логином и паролем напрямую, без локального форвардера
+(src.forwarder.chrome_route). Событие приходит только для остановленных запросов,
+поэтому в этом режиме на стадии запроса останавливается всё. Попапы, цели
+window.open и сервис-воркеры открывает сама страница, а не реплеер: их ловит
+TargetAuth через Target.setAutoAttach на канале браузера — цель стоит на паузе
+(waitForDebuggerOnStart), пока в её сессии не включён ответ на авторизацию.
+"""
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from src.cdp import CDPChannel
+from src.config import settings
+
+# капчи и антибот-проверки: без них сессия не проходит, блокировать нельзя
+ALLOW_DOMAINS = (
+    "captcha.yandex.net", "smartcaptcha.yandexcloud.net",
+    "challenges.cloudflare.com", "hcaptcha.com", "recaptcha.net",
+)
+# сторонняя аналитика; метрику яндекса не трогаем — её куки (_ym_*) часть фармящейся сессии
+TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "connect.facebook.net", "top-fwz1.mail.ru", "ads.adfox.ru",
+)
+# маски Network.setBlockedURLs для запасного пути без Fetch
+URL_MASKS = {
+    "Image": ("*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.ico"),
+    "Media": ("*.mp4", "*.webm", "*.m3u8", "*.mp3", "*.ogg"),
+    "Font": ("*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"),
+}
+
+# (команда Fetch.*, параметры) или None — решает следующий обработчик. Третьим элементом
+# можно передать then(result) -> Decision: что делать после ответа на команду
+# (например, Fetch.getResponseBody → сохранить тело → Fetch.continueRequest).
+# (DEFER, fn) — решение требует диска: fn() -> Decision выполняется в пуле I/O, а не в
+# потоке-читателе канала, который заодно разносит события навигации.
+Decision = Optional[tuple]
+DEFER = "defer"
+IO_WORKERS = 4
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_io_lock = threading.Lock()
+
+
+def io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _io_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="fetch-io")
+        return _io_pool
+
+
+def _result_or_none(fut):
+    try:
+        return fut.result()
+    except Exception:
+        return None
+
+
+@dataclass(frozen=True)
+class ResourcePolicy:
+    name: str
+    blocked_types: Tuple[str, ...] = ()    # Network.ResourceType
+    blocked_domains: Tuple[str, ...] = ()  # поддомены тоже
+    allow_domains: Tuple[str, ...] = ALLOW_DOMAINS
+
+    @property
+    def intercepts(self) -> bool:
+        return bool(self.blocked_types or self.blocked_domains)
+
+
+MEDIA_TYPES = ("Image", "Media", "Font")
+RESOURCE_POLICIES = {
+    "full": ResourcePolicy("full"),
+    "no-media": ResourcePolicy("no-media", blocked_types=MEDIA_TYPES),
+    "minimal": ResourcePolicy(
+        "minimal",
+        blocked_types=MEDIA_TYPES + ("Ping", "Prefetch", "Manifest", "TextTrack", "CSPViolationReport"),
+        blocked_domains=TRACKER_DOMAINS,
+    ),
+}
+DEFAULT_RESOURCE_POLICY = "full"
+
+
+def domain_match(host: str, domains) -> bool:
+    host = (host or "").lower()
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class FetchRouter:
+    """
+    Единственный подписчик Fetch.requestPaused вкладки: обработчики опрашиваются
+    по очереди, первое решение выигрывает, без решений запрос продолжается.
+    """
+
+    def __init__(self, proxy_auth: Optional[Tuple[str, str]] = None):
+        self.patterns: List[dict] = []
+        self.handlers: List[Callable[[dict], Decision]] = []
+        self.proxy_auth = proxy_auth  # (логин, пароль) апстрим-прокси
+
+    def add(self, handler: Callable[[dict], Decision], patterns: List[dict]):
+        self.handlers.append(handler)
+        self.patterns.extend(patterns)
+
+    @staticmethod
+    def proceed(params: dict) -> tuple:
+        return "Fetch.continueRequest", {"requestId": params["requestId"]}
+
+    def route(self, params: dict) -> tuple:
+        for handler in self.handlers:
+            try:
+                decision = handler(params)
+            except Exception:
+                decision = None
+            if decision:
+                return decision
+        return self.proceed(params)
+
+    def _dispatch(self, params: dict, decision: tuple, send: Callable[[str, dict], Any], defer: Callable):
+        """
+        send(method, params) возвращает future (concurrent или asyncio) — ответы не ждём.
+        defer(fn, callback) выполняет fn в пуле I/O и отдаёт результат в callback.
+        """
+        if decision[0] == DEFER:
+            defer(decision[1], lambda nxt: self._dispatch(params, nxt or self.proceed(params), send, defer))
+            return
+        method, reply, *then = decision
+
+        def done(fut):
+            try:
+                result = fut.result()
+            except Exception:
+                # запрос уже отменён / вкладка закрыта — если цепочка не дошла до конца, отпускаем запрос
+                if then:
+                    self._dispatch(params, self.proceed(params), send, defer)
+                return
+            if then:
+                try:
+                    nxt = then[0](result)
+                except Exception:
+                    nxt = None
+                self._dispatch(params, nxt or self.proceed(params), send, defer)
+
+        send(method, reply).add_done_callback(done)
+
+    def auth_reply(self, params: dict) -> dict:
+        """Ответ на Fetch.authRequired: логин прокси — только прокси, чужие запросы авторизации — как без нас."""
+        challenge = params.get("authChallenge", {})
+        if self.proxy_auth and challenge.get("source") == "Proxy":
+            login, password = self.proxy_auth
+            response = {"response": "ProvideCredentials", "username": login, "password": password or ""}
+        else:
+            response = {"response": "Default"}
+        return {"requestId": params["requestId"], "authChallengeResponse": response}
+
+    def enable_params(self) -> Optional[dict]:
+        if self.proxy_auth:
+            return {"patterns": self.patterns + [{"urlPattern": "*", "requestStage": "Request"}],
+                    "handleAuthRequests": True}
+        return {"patterns": self.patterns} if self.patterns else None
+
+    def install(self, cdp):
+        """cdp — CDPChannel: ответы уходят из потока-читателя без ожидания (send_nowait)."""
+        params = self.enable_params()
+        if params is None or not isinstance(cdp, CDPChannel):
+            return
+        defer = lambda fn, cb: io_pool().submit(fn).add_done_callback(lambda f: cb(_result_or_none(f)))
+        cdp.on("Fetch.requestPaused", lambda p: self._dispatch(p, self.route(p), cdp.send_nowait, defer))
+        if self.proxy_auth:
+            cdp.on("Fetch.authRequired", lambda p: cdp.send_nowait("Fetch.continueWithAuth", self.auth_reply(p)))
+        cdp.send("Fetch.enable", params)
+
+    async def install_async(self, conn, session_id: str):
+        """То же для target-сессии asyncio-движка (src.cdp_engine)."""
+        params = self.enable_params()
+        if params is None:
+            return
+        loop = asyncio.get_running_loop()
+        send = lambda method, reply: asyncio.ensure_future(conn.send(method, reply, session_id))
+        # результат из пула возвращается в цикл событий: send можно звать только из него
+        defer = lambda fn, cb: loop.run_in_executor(io_pool(), fn).add_done_callback(
+            lambda f: cb(_result_or_none(f)))
+        conn.on("Fetch.requestPaused", lambda p: self._dispatch(p, self.route(p), send, defer), session_id)
+        if self.proxy_auth:
+            conn.on("Fetch.authRequired",
+                    lambda p: send("Fetch.continueWithAuth", self.auth_reply(p)), session_id)
+        await conn.send("Fetch.enable", params, session_id)
+
+
+class TargetAuth:
+    """
+    Авторизация прокси в целях, которые открывает страница (попапы, window.open,
+    воркеры): без неё их запросы получают 407 без ответа. Работает на канале
+    браузера (src.cdp.open_browser_channel). Вкладки без opener открывает сам
+    реплеер и ставит в них install_interception — их только снимаем с паузы.
+    """
+
+    def __init__(self, proxy_auth: Tuple[str, str]):
+        self.router = FetchRouter(proxy_auth)
+        self.attached = Counter()  # подключённые цели по типам
+
+    def install(self, browser: CDPChannel):
+        browser.on("Target.attachedToTarget", lambda p: self._on_attached(browser, p))
+        browser.on("Target.detachedFromTarget", lambda p: browser.off_session(p.get("sessionId")))
+        browser.send("Target.setAutoAttach", {"autoAttach": True, "waitForDebuggerOnStart": True, "flatten": True})
+
+    def _on_attached(self, browser: CDPChannel, params: dict):
+        # поток-читатель: только send_nowait, команды одной сессии браузер выполняет по порядку
+        sid, info = params["sessionId"], params.get("targetInfo", {})
+        if not params.get("waitingForDebugger"):
+            return  # уже открытые цели — со своими обработчиками
+        if info.get("type") != "page" or info.get("openerId"):
+            send = lambda method, reply: browser.send_nowait(method, reply, sid)
+            browser.on("Fetch.requestPaused", lambda p: send(*self.router.proceed(p)), sid)
+            browser.on("Fetch.authRequired", lambda p: send("Fetch.continueWithAuth", self.router.auth_reply(p)), sid)
+            send("Fetch.enable", self.router.enable_params())
+            self.attached[info.get("type", "other")] += 1
+        browser.send_nowait("Runtime.runIfWaitingForDebugger", None, sid)
+
+
+class ResourceBlocker:
+    """Применяет ResourcePolicy ко всем вкладкам одного реплея и считает запросы/байты."""
+
+    def __init__(self, policy: str | ResourcePolicy = DEFAULT_RESOURCE_POLICY):
+        if isinstance(policy, str):
+            if policy not in RESOURCE_POLICIES:
+                raise ValueError(f"Unknown resource policy '{policy}', expected one of {sorted(RESOURCE_POLICIES)}")
+            policy = RESOURCE_POLICIES[policy]
+        self.policy = policy
+        extra = [d.strip().lower() for d in settings.RESOURCE_ALLOW_DOMAINS.split(",") if d.strip()]
+        self.allow_domains = tuple(policy.allow_domains) + tuple(extra)
+        self.blocked: Counter = Counter()        # тип ресурса → запросов
+        self.allowed_bytes: Counter = Counter()  # тип ресурса → байт по сети
+        self.allowed_requests = 0
+        self.local_requests = 0                  # отданы из кэша ассетов, через прокси не шли
+        self._types: dict = {}                   # requestId → тип (до loadingFinished / loadingFailed)
+        self._local: set = set()                 # requestId ответов из кэша (до loadingFinished / loadingFailed)
+        self._lock = threading.Lock()
+
+    # ---------- решение ----------------------------------------------------
+
+    def patterns(self) -> List[dict]:
+        p = self.policy
+        out = [{"resourceType": t, "requestStage": "Request"} for t in p.blocked_types]
+        for d in p.blocked_domains:
+            out += [{"urlPattern": f"*://{d}/*", "requestStage": "Request"},
+                    {"urlPattern": f"*://*.{d}/*", "requestStage": "Request"}]
+        return out
+
+    def decide(self, params: dict) -> Decision:
+        if "responseStatusCode" in params or "responseErrorReason" in params:
+            return None  # стадия ответа — это чужие шаблоны (кэш ассетов)
+        host = urlsplit(params.get("request", {}).get("url", "")).hostname or ""
+        if domain_match(host, self.allow_domains):
+            return None
+        typ = params.get("resourceType", "Other")
+        if typ in self.policy.blocked_types or domain_match(host, self.policy.blocked_domains):
+            with self._lock:
+                self.blocked[typ] += 1
+            return "Fetch.failRequest", {"requestId": params["requestId"], "errorReason": "BlockedByClient"}
+        return None
+
+    # ---------- учёт трафика -----------------------------------------------
+
+    def _on_response(self, params: dict):
+        self._types[params.get("requestId")] = params.get("type", "Other")
+
+    def mark_local(self, request_id: Optional[str]):
+        """Ответ на запрос отдан без сети (Fetch.fulfillRequest из кэша) — в байты прокси не считаем."""
+        if request_id:
+            with self._lock:
+                self._local.add(request_id)
+
+    def _on_finished(self, params: dict):
+        rid = params.get("requestId")
+        typ = self._types.pop(rid, "Other")
+        with self._lock:
+            if rid in self._local:
+                self._local.discard(rid)
+                self.local_requests += 1
+                return
+            self.allowed_requests += 1
+            self.allowed_bytes[typ] += int(params.get("encodedDataLength", 0))
+
+    def _on_failed(self, params: dict):
+        """Запрос оборвался (в т.ч. заблокирован нами) — loadingFinished не будет, запись больше не нужна."""
+        rid = params.get("requestId")
+        self._types.pop(rid, None)
+        with self._lock:
+            self._local.discard(rid)
+
+    # ---------- установка --------------------------------------------------
+
+    def install(self, cdp, router: FetchRouter):
+        """
+        Ставит профиль во вкладку: учёт трафика + обработчик в router вкладки
+        (его Fetch.enable вызывает владелец после всех add). Для DriverCDP — маски URL.
+        """
+        if not isinstance(cdp, CDPChannel):
+            masks = [m for t in self.policy.blocked_types for m in URL_MASKS.get(t, ())]
+            masks += [f"*{d}/*" for d in self.policy.blocked_domains]
+            if masks:
+                cdp.send_batch([("Network.enable", {}), ("Network.setBlockedURLs", {"urls": masks})])
+            return
+        cdp.on("Network.responseReceived", self._on_response)
+        cdp.on("Network.loadingFinished", self._on_finished)
+        cdp.on("Network.loadingFailed", self._on_failed)
+        cdp.send("Network.enable")
+        router.add(self.decide, self.patterns())
+
+    async def install_async(self, conn, session_id: str, router: FetchRouter):
+        conn.on("Network.responseReceived", self._on_response, session_id)
+        conn.on("Network.loadingFinished", self._on_finished, session_id)
+        conn.on("Network.loadingFailed", self._on_failed, session_id)
+        await conn.send("Network.enable", {}, session_id)
+        router.add(self.decide, self.patterns())
+
+    def summary(self) -> dict:
+        return {
+            "policy": self.policy.name,
+            "blocked": {"requests": sum(self.blocked.values()), "by_type": dict(self.blocked)},
+            "allowed": {"requests": self.allowed_requests, "bytes": sum(self.allowed_bytes.values()),
+                        "by_type": dict(self.allowed_bytes)},
+            "from_cache": {"requests": self.local_requests},
+        }
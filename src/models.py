@@ -1,7 +1,7 @@
 from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime,
-    ForeignKey, JSON, Text, Enum, Index
+    ForeignKey, JSON, Text, Enum, Index, Float
 )
 from sqlalchemy.orm import relationship
 import enum
@@ -46,6 +46,11 @@ class Proxy(Base):
     type = Column(String, default="http")  # HTTP, HTTPS, SOCKS5
     is_working = Column(Boolean, default=True)
     last_checked = Column(DateTime)
+    # результат последней проверки src.proxy_checker
+    connect_ms = Column(Integer)
+    tls_ms = Column(Integer)
+    exit_ip = Column(String)
+    check_error = Column(Text)
 
     farm_tasks = relationship("FarmTask", back_populates="proxy")
     user_sessions = relationship("UserSession", back_populates="proxy")
@@ -72,10 +77,13 @@ class FarmTask(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     completed_at = Column(DateTime)
     base_session_id = Column(Integer, nullable=True)
+    # профиль загрузки ресурсов при реплее: full / no-media / minimal (src.interception)
+    resource_policy = Column(String, default="full", server_default="full", nullable=False)
 
     instruction_set = relationship("InstructionSet")
     proxy = relationship("Proxy", back_populates="farm_tasks")
     user_session = relationship("UserSession", back_populates="farm_task", uselist=False)
+    reports = relationship("FarmReport", back_populates="farm_task")
 
 
 
@@ -119,12 +127,42 @@ class JobTask(Base):
     attempts_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     completed_at = Column(DateTime)
+    resource_policy = Column(String, default="full", server_default="full", nullable=False)
 
     instruction_set = relationship("InstructionSet")
     session = relationship("UserSession", back_populates="job_tasks")
     reports = relationship("JobReport", back_populates="job_task")
 
 
+class FarmReport(Base):
+    """Итог прогона фарминга — как JobReport для боевых задач (профиль реплея в report_metadata)."""
+    __tablename__ = "farm_reports"
+    __table_args__ = (
+        Index('ix_farm_reports_farm_task_created', 'farm_task_id', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    farm_task_id = Column(Integer, ForeignKey("farm_tasks.id"), nullable=False)
+    user_session_id = Column(Integer, ForeignKey("user_sessions.id"), nullable=True)
+    result_text = Column(Text)
+    report_metadata = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    farm_task = relationship("FarmTask", back_populates="reports")
+
+
+class DomainSettleStat(Base):
+    """Сколько в среднем устаивается страница домена (src.settle), по замерам прошлых реплеев."""
+    __tablename__ = "domain_settle_stats"
+
+    domain = Column(String, primary_key=True)
+    samples = Column(Integer, default=0, nullable=False)
+    avg_ms = Column(Float, default=0.0, nullable=False)
+    timeouts = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class JobReport(Base):
     __tablename__ = "job_reports"
     __table_args__ = (
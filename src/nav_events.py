@@ -0,0 +1,117 @@
+"""
+Шина навигационных событий вкладки поверх CDP-канала.
+
+check_captcha читал driver.current_url перед каждым событием,
+wait_for_dom_ready опрашивал document.readyState через execute_script,
+а completed_navigation принимался по эвристикам времени. NavBus подписан на
+Page.frameNavigated / Page.loadEventFired / Page.lifecycleEvent вкладки и
+хранит последнее состояние главного фрейма: URL, номер навигации, готовность
+документа. Ожидания будятся событиями, а не опросом.
+
+Если у вкладки нет прямого websocket-канала (DriverCDP — событий нет),
+bus.live == False и вызывающий код возвращается к опросу через WebDriver.
+"""
+import threading
+import time
+from typing import Callable, List, Optional
+
+from src.cdp import CDPChannel
+
+# этапы Page.lifecycleEvent, которые считаем «документ готов»
+READY_EVENTS = {"load"}
+DOM_EVENTS = {"DOMContentLoaded"}
+
+
+class NavBus:
+    def __init__(self, channel, url: str = "about:blank"):
+        self.channel = channel
+        self.live = isinstance(channel, CDPChannel)
+        self.url = url
+        self.frame_id: Optional[str] = None
+        self.nav_seq = 0  # число навигаций главного фрейма
+        self.last_nav_ts = 0.0
+        self.dom_ready = True
+        self.ready = True
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[str, bool], None]] = []
+        if self.live:
+            channel.on("Page.frameNavigated", self._on_frame_navigated)
+            channel.on("Page.navigatedWithinDocument", self._on_within_document)
+            channel.on("Page.loadEventFired", self._on_load)
+            channel.on("Page.lifecycleEvent", self._on_lifecycle)
+            try:
+                channel.send_batch([("Page.enable", {}), ("Page.setLifecycleEventsEnabled", {"enabled": True})])
+                tree = channel.send("Page.getFrameTree")["frameTree"]["frame"]
+                self.frame_id = tree.get("id")
+                self.url = tree.get("url") or url
+            except Exception:
+                self.live = False
+
+    def on_navigate(self, callback: Callable[[str, bool], None]):
+        """
+        callback(url, new_document) на каждую смену URL главного фрейма
+        (вызывается из потока-читателя канала).
+        """
+        self._listeners.append(callback)
+
+    # ---------- события ----------------------------------------------------
+
+    def _main(self, frame_id: Optional[str]) -> bool:
+        return frame_id is None or frame_id == self.frame_id
+
+    def _navigated(self, url: str, new_document: bool = True):
+        with self._cond:
+            self.url = url
+            if new_document:
+                self.nav_seq += 1
+                self.last_nav_ts = time.time()
+            self._cond.notify_all()
+        for cb in list(self._listeners):
+            try:
+                cb(url, new_document)
+            except Exception:
+                pass
+
+    def _on_frame_navigated(self, params: dict):
+        frame = params.get("frame", {})
+        if frame.get("parentId"):
+            return
+        self.frame_id = frame.get("id", self.frame_id)
+        with self._cond:
+            self.ready = self.dom_ready = False
+        self._navigated(frame.get("url", self.url))
+
+    def _on_within_document(self, params: dict):
+        # #hash / history API: URL меняется, но это не новая навигация (completed_navigation её не пишет)
+        if self._main(params.get("frameId")):
+            self._navigated(params.get("url", self.url), new_document=False)
+
+    def _on_load(self, _params: dict):
+        with self._cond:
+            self.ready = self.dom_ready = True
+            self._cond.notify_all()
+
+    def _on_lifecycle(self, params: dict):
+        if not self._main(params.get("frameId")):
+            return
+        name = params.get("name")
+        with self._cond:
+            if name in DOM_EVENTS:
+                self.dom_ready = True
+            elif name in READY_EVENTS:
+                self.ready = self.dom_ready = True
+            elif name == "init":
+                # новый документ (в т.ч. до frameNavigated) — готовность сбрасывается
+                self.ready = self.dom_ready = False
+            self._cond.notify_all()
+
+    # ---------- ожидания ---------------------------------------------------
+
+    def wait_ready(self, timeout: float = 10) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.ready, timeout)
+
+    def wait_navigation(self, after_seq: int, timeout: float) -> bool:
+        """Ждёт навигацию главного фрейма с номером > after_seq."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.nav_seq > after_seq, timeout)
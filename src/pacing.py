@@ -0,0 +1,127 @@
+"""
+Политики темпа реплея.
+
+Раньше темп задавался глобальным SPEED и россыпью time.sleep(random.uniform(...))
+внутри replay_events. Теперь все паузы идут через Pacer с именованной политикой:
+
+  faithful   — паузы как в записи (с джиттером), без потолка простоя;
+  compressed — поведение по умолчанию: простой между событиями не больше
+               max_gap, но не меньше min_dwell для данного типа события;
+  turbo      — для доверенных целей: паузы сжаты до минимума.
+
+Записанная delta уже несёт разброс темпа самого пользователя, поэтому джиттер
+поверх неё небольшой и центрирован на 1: множитель равномерно в 1 ± jitter
+политики.
+Pacer считает, сколько времени реально проспал, — это бюджет для отчёта.
+AsyncPacer — то же для asyncio-движка (src.cdp_engine): паузы через asyncio.sleep.
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class PacingPolicy:
+    name: str
+    scale: float = 1.0                    # множитель записанных пауз между событиями
+    max_gap: Optional[float] = None       # потолок паузы между событиями, с
+    floor: float = 0.015                  # минимальная пауза между событиями, с
+    jitter: float = 0.15                  # разброс множителя пауз между событиями вокруг 1 (±)
+    intra_scale: float = 1.0              # множитель пауз внутри события (шаги скролла, dwell hover…)
+    min_dwell: Dict[str, float] = field(default_factory=dict)
+
+
+POLICIES: Dict[str, PacingPolicy] = {
+    "faithful": PacingPolicy("faithful", max_gap=30.0),
+    "compressed": PacingPolicy(
+        "compressed",
+        max_gap=1.2,
+        min_dwell={
+            "click": 0.08, "keydown": 0.03, "input": 0.05, "hover": 0.1, "hover_generic": 0.1,
+            "navigate_intent": 0.2, "wheel": 0.03, "scroll": 0.05,
+        },
+    ),
+    "turbo": PacingPolicy("turbo", scale=0.1, max_gap=0.2, floor=0.0, jitter=0.0, intra_scale=0.1),
+}
+DEFAULT_POLICY = "compressed"
+
+
+class Pacer:
+    def __init__(self, policy: str | PacingPolicy = DEFAULT_POLICY):
+        if isinstance(policy, str):
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown pacing policy '{policy}', expected one of {sorted(POLICIES)}")
+            policy = POLICIES[policy]
+        self.policy = policy
+        self.total_slept = 0.0
+        self.by_kind: Dict[str, float] = {}
+
+    def _account(self, kind: str, seconds: float):
+        self.total_slept += seconds
+        self.by_kind[kind] = self.by_kind.get(kind, 0.0) + seconds
+
+    def _sleep(self, kind: str, seconds: float):
+        if seconds <= 0:
+            return
+        time.sleep(seconds)
+        self._account(kind, seconds)
+
+    def gap_seconds(self, typ: str, delta_ms: float) -> float:
+        p = self.policy
+        base = delta_ms / 1000 * p.scale
+        sleep = base * random.uniform(1 - p.jitter, 1 + p.jitter)
+        sleep = max(sleep, p.floor, p.min_dwell.get(typ, 0.0))
+        if p.max_gap is not None:
+            sleep = min(sleep, p.max_gap)
+        return sleep
+
+    def gap(self, typ: str, delta_ms: float):
+        """Пауза перед событием по записанной delta."""
+        self._sleep("gap", self.gap_seconds(typ, delta_ms))
+
+    def sleep(self, kind: str, seconds: float):
+        """Пауза внутри события (масштабируется intra_scale)."""
+        self._sleep(kind, seconds * self.policy.intra_scale)
+
+    def pause(self, kind: str, lo: float, hi: float):
+        self.sleep(kind, random.uniform(lo, hi))
+
+    def wait(self, kind: str, seconds: float):
+        """Ожидание, не зависящее от политики (прогрузка страницы) — только учитывается в бюджете."""
+        self._sleep(kind, seconds)
+
+    def spent(self, kind: str, seconds: float):
+        """Учитывает в бюджете ожидание, прошедшее вне Pacer (например, src.settle)."""
+        if seconds > 0:
+            self._account(kind, seconds)
+
+    def summary(self) -> dict:
+        return {
+            "policy": self.policy.name,
+            "total_slept": round(self.total_slept, 3),
+            "by_kind": {k: round(v, 3) for k, v in sorted(self.by_kind.items())},
+        }
+
+
+class AsyncPacer(Pacer):
+    """Pacer для корутин: те же политики и учёт, но паузы не блокируют event loop."""
+
+    async def _asleep(self, kind: str, seconds: float):
+        if seconds <= 0:
+            return
+        await asyncio.sleep(seconds)
+        self._account(kind, seconds)
+
+    async def gap(self, typ: str, delta_ms: float):
+        await self._asleep("gap", self.gap_seconds(typ, delta_ms))
+
+    async def sleep(self, kind: str, seconds: float):
+        await self._asleep(kind, seconds * self.policy.intra_scale)
+
+    async def pause(self, kind: str, lo: float, hi: float):
+        await self.sleep(kind, random.uniform(lo, hi))
+
+    async def wait(self, kind: str, seconds: float):
+        await self._asleep(kind, seconds)
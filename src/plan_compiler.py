@@ -0,0 +1,169 @@
+"""
+Компилятор InstructionSet.instructions в план исполнения.
+
+replay_events на каждом прогоне заново сортировал события, искал first_url,
+проверял skip_substrings и собирал селекторы. Здесь это делается один раз:
+  • шаги отсортированы по timestamp, first_url посчитан по вкладкам;
+  • для каждого шага заранее собран аргумент in-page резолвера (вкл. combined selector);
+  • оптимизирующие проходы: выкинуть пропускаемые события, схлопнуть серии
+    input в итоговое значение, слить подряд идущие wheel и mouse_move.
+Скомпилированные планы кэшируются на процесс по (id набора, created_at, skip).
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from src.element_resolver import resolver_payload
+
+# события, для которых резолвер вызывается — им заранее готовим payload
+RESOLVED_TYPES = {"click", "keydown", "hover", "hover_generic", "navigate_intent", "input"}
+
+
+@dataclass(slots=True)
+class Step:
+    type: str
+    tab: Optional[int]
+    delta: float  # мс до события (как ev["delta"])
+    data: Dict[str, Any]
+    timestamp: float = 0
+    payload: Optional[Dict[str, Any]] = None  # аргумент RESOLVER_JS
+    merged: int = 1  # сколько исходных событий свёрнуто в шаг
+
+
+@dataclass
+class ExecutionPlan:
+    steps: List[Step]
+    first_url: Dict[Any, str]
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+# ---------- passes ---------------------------------------------------------
+
+def _same_run(a: Step, b: Step, typ: str) -> bool:
+    return a.type == typ and b.type == typ and a.tab == b.tab
+
+
+def merge_wheels(steps: List[Step]) -> List[Step]:
+    out: List[Step] = []
+    for st in steps:
+        prev = out[-1] if out else None
+        if prev and _same_run(prev, st, "wheel"):
+            total = prev.data.get("deltaY", prev.data.get("y", 0)) + st.data.get("deltaY", st.data.get("y", 0))
+            prev.data = {**prev.data, **st.data, "deltaY": total,
+                         "delta": prev.data.get("delta", 0) + st.data.get("delta", 0)}
+            prev.delta += st.delta
+            prev.merged += st.merged
+            continue
+        out.append(st)
+    return out
+
+
+def collapse_inputs(steps: List[Step]) -> List[Step]:
+    out: List[Step] = []
+    for st in steps:
+        prev = out[-1] if out else None
+        if (prev and _same_run(prev, st, "input")
+                and prev.data.get("selector") == st.data.get("selector")):
+            # промежуточные значения поля не нужны — остаётся финальное
+            st.delta += prev.delta
+            st.merged += prev.merged
+            out[-1] = st
+            continue
+        out.append(st)
+    return out
+
+
+def fold_mouse_moves(steps: List[Step]) -> List[Step]:
+    out: List[Step] = []
+    for st in steps:
+        prev = out[-1] if out else None
+        if (prev and _same_run(prev, st, "mouse_move")
+                and prev.data.get("pointerType", "mouse") == st.data.get("pointerType", "mouse")):
+            prev.data = {**prev.data, "positions": prev.data.get("positions", []) + st.data.get("positions", [])}
+            prev.delta += st.delta
+            prev.merged += st.merged
+            continue
+        out.append(st)
+    return out
+
+
+PASSES = (collapse_inputs, merge_wheels, fold_mouse_moves)
+
+
+# ---------- compile --------------------------------------------------------
+
+def compute_first_urls(events: Iterable[Dict[str, Any]]) -> Dict[Any, str]:
+    first_url: Dict[Any, str] = {}
+    for ev in events:
+        raw = ev.get("data")
+        if isinstance(raw, dict):
+            u = raw.get("url") or raw.get("href")
+            if u and not u.startswith(("chrome:", "about:")):
+                first_url.setdefault(ev.get("tabId"), u)
+    return first_url
+
+
+def compile_plan(events: List[Dict[str, Any]], skip_substrings: Optional[Iterable[str]] = None) -> ExecutionPlan:
+    skip = {s.lower() for s in (skip_substrings or ())}
+    # сортируем по timestamp, чтобы реплей шёл стабильно и последовательно (исходный список не трогаем)
+    ordered = sorted(events, key=lambda e: e.get("timestamp", 0))
+    first_url = compute_first_urls(ordered)
+
+    steps: List[Step] = []
+    skipped = carried = 0
+    carry = 0.0
+    for ev in ordered:
+        typ = ev.get("type", "").lower()
+        if any(sub in typ for sub in skip):
+            skipped += 1
+            continue
+        if ev.get("tabId") is None:
+            # у события без вкладки действия нет — только пауза, переносим её на следующий шаг
+            carry += ev.get("delta", 150)
+            carried += 1
+            continue
+        data = ev.get("data", {}) or {}
+        steps.append(Step(
+            type=typ,
+            tab=ev.get("tabId"),
+            delta=ev.get("delta", 150) + carry,
+            data=data,
+            timestamp=ev.get("timestamp", 0),
+        ))
+        carry = 0.0
+
+    for opt in PASSES:
+        steps = opt(steps)
+
+    for st in steps:
+        if st.type in RESOLVED_TYPES:
+            st.payload = resolver_payload(st.data)
+
+    stats = {
+        "events": len(ordered),
+        "steps": len(steps),
+        "skipped": skipped,
+        "tabless": carried,
+        "coalesced": sum(st.merged - 1 for st in steps),
+    }
+    return ExecutionPlan(steps=steps, first_url=first_url, stats=stats)
+
+
+_plans: Dict[tuple, ExecutionPlan] = {}
+_plans_lock = threading.Lock()
+MAX_CACHED_PLANS = 64
+
+
+def get_plan(instruction_set, skip_substrings: Optional[Iterable[str]] = None) -> ExecutionPlan:
+    """План для InstructionSet; наборы не редактируются, поэтому кэшируем на процесс."""
+    skip: FrozenSet[str] = frozenset(s.lower() for s in (skip_substrings or ()))
+    key = (instruction_set.id, instruction_set.created_at, skip)
+    with _plans_lock:
+        plan = _plans.get(key)
+    if plan is None:
+        plan = compile_plan(instruction_set.instructions, skip)
+        with _plans_lock:
+            if len(_plans) >= MAX_CACHED_PLANS:
+                _plans.pop(next(iter(_plans)))
+            _plans[key] = plan
+    return plan
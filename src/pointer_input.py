@@ -0,0 +1,166 @@
+"""
+Указательный ввод через CDP Input.dispatchMouseEvent.
+
+W3C Actions (ActionBuilder) отправляет всю траекторию одним perform(), но
+chromedriver исполняет каждую точку с паузами, а synthetic_hover делал два
+perform() и отдельный el.rect. Здесь траектория превращается в список
+событий с точными timestamp-ами; события одного кадра (~16 мс) уходят в
+канал пачкой без ожидания ответов, ответы собираются в конце.
+Списки событий строятся отдельно от отправки (*_events), поэтому их же
+отправляет asyncio-движок (adispatch, см. src.cdp_engine).
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+FRAME = 1 / 60
+# шаг между точками записи, если в ней нет собственных отметок времени
+DEFAULT_POINT_STEP = 0.01
+
+Timeline = List[Tuple[float, float, float]]  # (смещение от начала, с; x; y)
+
+
+def _point_time(pt: Dict[str, Any]) -> Optional[float]:
+    for key in ("t", "timestamp", "time"):
+        if pt.get(key) is not None:
+            return float(pt[key]) / 1000.0
+    return None
+
+
+def build_timeline(points: List[Dict[str, Any]], duration: Optional[float] = None) -> Timeline:
+    """
+    Точки записи → (offset, x, y). Берём отметки времени из самих точек (мс),
+    иначе распределяем равномерно по duration (по умолчанию DEFAULT_POINT_STEP на точку).
+    """
+    if not points:
+        return []
+    times = [_point_time(p) for p in points]
+    if all(t is not None for t in times):
+        t0 = times[0]
+        return [(t - t0, p["x"], p["y"]) for t, p in zip(times, points)]
+    n = len(points)
+    if duration is None:
+        duration = DEFAULT_POINT_STEP * (n - 1)
+    step = duration / (n - 1) if n > 1 else 0.0
+    return [(i * step, p["x"], p["y"]) for i, p in enumerate(points)]
+
+
+Events = List[Tuple[float, dict]]  # (смещение от начала, с; параметры Input.dispatchMouseEvent)
+
+
+def dispatch(cdp, events: Events):
+    """
+    Отправляет (offset, params) Input.dispatchMouseEvent по расписанию.
+    Внутри кадра не спим — события уходят пачкой; timestamp ставится точно по расписанию.
+    """
+    if not events:
+        return
+    start, wall = time.monotonic(), time.time()
+    futs = []
+    for off, params in events:
+        lag = off - (time.monotonic() - start)
+        if lag > FRAME:
+            time.sleep(lag)
+        params["timestamp"] = wall + off
+        futs.append(cdp.send_nowait("Input.dispatchMouseEvent", params))
+    for f in futs:
+        f.result(10)
+    last = events[-1][1]
+    cdp.pointer_pos = (last["x"], last["y"])
+
+
+async def adispatch(page, events: Events):
+    """
+    То же расписание для asyncio: page.send — корутина, внутри кадра команды
+    уходят задачами без ожидания, ответы собираются в конце.
+    """
+    if not events:
+        return
+    loop = asyncio.get_running_loop()
+    start, wall = loop.time(), time.time()
+    pending = []
+    for off, params in events:
+        lag = off - (loop.time() - start)
+        if lag > FRAME:
+            await asyncio.sleep(lag)
+        params["timestamp"] = wall + off
+        pending.append(asyncio.ensure_future(page.send("Input.dispatchMouseEvent", params)))
+    await asyncio.gather(*pending)
+    last = events[-1][1]
+    page.pointer_pos = (last["x"], last["y"])
+
+
+def _moved(x, y, pointer_type="mouse", buttons=0) -> dict:
+    params = {"type": "mouseMoved", "x": x, "y": y, "pointerType": pointer_type, "buttons": buttons}
+    if buttons:
+        params["button"] = "left"
+    return params
+
+
+def move_events(timeline: Timeline, pointer_type: str = "mouse") -> Events:
+    """Перемещение курсора без нажатия (mouse_move / hover)."""
+    return [(off, _moved(x, y, pointer_type)) for off, x, y in timeline]
+
+
+def drag_events(timeline: Timeline, pointer_type: str = "mouse") -> Events:
+    """Нажать в первой точке, провести по траектории, отпустить в последней."""
+    if not timeline:
+        return []
+    off0, x0, y0 = timeline[0]
+    offN, xN, yN = timeline[-1]
+    events = [
+        (off0, _moved(x0, y0, pointer_type)),
+        (off0, {"type": "mousePressed", "x": x0, "y": y0, "button": "left", "buttons": 1,
+                "clickCount": 1, "pointerType": pointer_type}),
+    ]
+    events += [(off, _moved(x, y, pointer_type, buttons=1)) for off, x, y in timeline[1:]]
+    events.append((offN, {"type": "mouseReleased", "x": xN, "y": yN, "button": "left", "buttons": 0,
+                          "clickCount": 1, "pointerType": pointer_type}))
+    return events
+
+
+def click_events(x: float, y: float) -> Events:
+    """Координатный клик: move + press + release одной пачкой."""
+    return [
+        (0.0, _moved(x, y)),
+        (0.0, {"type": "mousePressed", "x": x, "y": y, "button": "left", "buttons": 1, "clickCount": 1}),
+        (0.0, {"type": "mouseReleased", "x": x, "y": y, "button": "left", "buttons": 0, "clickCount": 1}),
+    ]
+
+
+def move_path(cdp, timeline: Timeline, pointer_type: str = "mouse"):
+    dispatch(cdp, move_events(timeline, pointer_type))
+
+
+def drag_path(cdp, timeline: Timeline, pointer_type: str = "mouse"):
+    dispatch(cdp, drag_events(timeline, pointer_type))
+
+
+def click_at(cdp, x: float, y: float):
+    dispatch(cdp, click_events(x, y))
+
+
+def hover_timeline(cdp, tx: float, ty: float, total: float) -> Tuple[Timeline, float]:
+    """
+    Человечный hover, привязанный к лог-дельте total (с):
+      - 50–60% времени — движение к цели за 3–6 шагов с шумом ±1px,
+      - 5–10% — одно микроколебание вокруг цели,
+      - остаток — dwell (возвращается вторым значением, его спит вызывающий).
+    Движение начинается с последней известной позиции курсора на вкладке.
+    """
+    sx, sy = getattr(cdp, "pointer_pos", (0, 0))
+    movement_time = total * random.uniform(0.5, 0.6)
+    jitter_time = total * random.uniform(0.05, 0.1)
+    dwell_time = max(0.0, total - movement_time - jitter_time)
+
+    steps = random.randint(3, 6)
+    timeline: Timeline = []
+    for i in range(steps):
+        t = (i + 1) / steps
+        x = sx + (tx - sx) * t + random.gauss(0, 1)
+        y = sy + (ty - sy) * t + random.gauss(0, 1)
+        timeline.append((movement_time * t, int(x), int(y)))
+    # микроколебание сразу после подхода; его выдержка входит в dwell
+    timeline.append((movement_time, int(tx + random.uniform(-2, 2)), int(ty + random.uniform(-2, 2))))
+    return timeline, jitter_time + dwell_time
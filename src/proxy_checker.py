@@ -0,0 +1,180 @@
+"""
+Фоновая проверка прокси: держит Proxy.is_working / last_checked актуальными.
+
+Раньше живость прокси проверялась загрузкой https://api.ipify.org в браузере
+в начале реплея, а is_working и last_checked не обновлялись никогда.
+Здесь все прокси проверяются одновременно (не больше PROXY_CHECK_CONCURRENCY
+сразу) без браузера: TCP до прокси → CONNECT (или SOCKS5) до ipify →
+TLS → GET. Меряются время соединения с прокси и TLS-рукопожатия, выходной IP.
+Результаты пишутся в таблицу proxies одним bulk-обновлением (src.crud).
+
+Задача проверки запускается Celery beat раз в PROXY_CHECK_INTERVAL секунд;
+farm_cookie не открывает ipify в браузере, если прокси проверен недавно.
+
+Отказом прокси считаются только сетевые и протокольные ошибки (PROXY_ERRORS).
+Любое другое исключение — ошибка самого чекера: она уходит в лог, а результат
+помечается inconclusive, и is_working прокси не меняется — иначе одна ошибка
+в коде выключила бы весь парк прокси.
+"""
+import asyncio
+import base64
+import ipaddress
+import json
+import logging
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from src.config import settings
+
+IP_ECHO_HOST = "api.ipify.org"
+IP_ECHO_PATH = "/?format=json"
+# ошибки, за которые отвечает прокси (сеть, TLS, туннель, ответ ipify)
+PROXY_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, KeyError)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProxySpec:
+    ip: str
+    port: int
+    type: str = "http"
+    login: Optional[str] = None
+    password: Optional[str] = None
+    id: Optional[int] = None
+
+    @classmethod
+    def of(cls, proxy) -> "ProxySpec":
+        """Из src.models.Proxy или src.schemas.ProxyCreate."""
+        return cls(proxy.ip, proxy.port, (proxy.type or "http").lower(), proxy.login, proxy.password,
+                   getattr(proxy, "id", None))
+
+
+@dataclass
+class ProbeResult:
+    ok: bool
+    connect_ms: Optional[int] = None
+    tls_ms: Optional[int] = None
+    exit_ip: Optional[str] = None
+    error: Optional[str] = None
+    checked_at: Optional[datetime] = None
+    inconclusive: bool = False  # проверка упала на стороне чекера — о прокси ничего не известно
+
+
+def _ms(since: float) -> int:
+    return int((time.perf_counter() - since) * 1000)
+
+
+async def _http_connect(reader, writer, spec: ProxySpec, host: str, port: int):
+    lines = [f"CONNECT {host}:{port} HTTP/1.1", f"Host: {host}:{port}"]
+    if spec.login:
+        token = base64.b64encode(f"{spec.login}:{spec.password or ''}".encode()).decode()
+        lines.append(f"Proxy-Authorization: Basic {token}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = head.split(b"\r\n", 1)[0].decode(errors="replace")
+    if " 200" not in status:
+        raise ConnectionError(f"CONNECT refused: {status}")
+
+
+async def socks5_connect(reader, writer, spec: ProxySpec, host: str, port: int):
+    methods = b"\x00\x02" if spec.login else b"\x00"
+    writer.write(b"\x05" + bytes([len(methods)]) + methods)
+    await writer.drain()
+    ver, method = await reader.readexactly(2)
+    if method == 0x02:
+        user, pwd = (spec.login or "").encode(), (spec.password or "").encode()
+        writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(pwd)]) + pwd)
+        await writer.drain()
+        if (await reader.readexactly(2))[1] != 0:
+            raise ConnectionError("SOCKS5 auth failed")
+    elif method != 0x00:
+        raise ConnectionError("SOCKS5: no acceptable auth method")
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(host)]) + host.encode() + struct.pack(">H", port))
+    await writer.drain()
+    reply = await reader.readexactly(4)
+    if reply[1] != 0:
+        raise ConnectionError(f"SOCKS5 connect failed, code {reply[1]}")
+    # адрес привязки в ответе: IPv4 / домен / IPv6
+    skip = {1: 4, 4: 16}.get(reply[3])
+    if skip is None:
+        skip = (await reader.readexactly(1))[0]
+    await reader.readexactly(skip + 2)
+
+
+async def start_tls(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, ctx: ssl.SSLContext,
+                    server_hostname: str):
+    """
+    TLS поверх уже открытого туннеля. StreamWriter.start_tls есть только с Python 3.11
+    (образ — 3.10): там — через loop.start_tls с новой парой reader/writer.
+    """
+    if hasattr(writer, "start_tls"):
+        await writer.start_tls(ctx, server_hostname=server_hostname)
+        return reader, writer
+    await writer.drain()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    protocol = asyncio.StreamReaderProtocol(reader)
+    transport = await loop.start_tls(writer.transport, protocol, ctx, server_hostname=server_hostname)
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+async def probe(spec: ProxySpec, timeout: float = 10) -> ProbeResult:
+    """Одна проверка прокси: соединение, туннель, TLS до ipify, выходной IP."""
+    res = ProbeResult(ok=False, checked_at=datetime.utcnow())
+    writer = None
+    try:
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(spec.ip, spec.port), timeout)
+        res.connect_ms = _ms(t0)
+
+        tunnel = socks5_connect if spec.type.startswith("socks") else _http_connect
+        await asyncio.wait_for(tunnel(reader, writer, spec, IP_ECHO_HOST, 443), timeout)
+
+        t1 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            start_tls(reader, writer, ssl.create_default_context(), IP_ECHO_HOST), timeout)
+        res.tls_ms = _ms(t1)
+
+        writer.write(f"GET {IP_ECHO_PATH} HTTP/1.1\r\nHost: {IP_ECHO_HOST}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+        body = raw.split(b"\r\n\r\n", 1)[-1]
+        ip = json.loads(body[body.index(b"{"):body.rindex(b"}") + 1])["ip"]
+        res.exit_ip = str(ipaddress.ip_address(ip))
+        res.ok = True
+    except PROXY_ERRORS as e:
+        res.error = f"{type(e).__name__}: {e}"[:300] if str(e) else type(e).__name__
+    except Exception as e:
+        logger.exception("proxy check of %s:%s failed inside the checker", spec.ip, spec.port)
+        res.inconclusive = True
+        res.error = f"checker error: {type(e).__name__}: {e}"[:300]
+    finally:
+        if writer is not None:
+            writer.close()
+    return res
+
+
+async def check_all(specs: Iterable[ProxySpec], concurrency: Optional[int] = None,
+                    timeout: Optional[float] = None) -> List[ProbeResult]:
+    """Проверяет все прокси одним проходом, не больше concurrency одновременно; порядок — как у specs."""
+    sem = asyncio.Semaphore(concurrency or settings.PROXY_CHECK_CONCURRENCY)
+    timeout = timeout or settings.PROXY_CHECK_TIMEOUT
+
+    async def bounded(spec: ProxySpec) -> ProbeResult:
+        async with sem:
+            return await probe(spec, timeout)
+
+    return await asyncio.gather(*(bounded(s) for s in specs))
+
+
+def recently_verified(proxy, max_age: Optional[float] = None) -> bool:
+    """Прокси проверен фоновым чекером не раньше max_age секунд назад (PROXY_FRESH_SECONDS)."""
+    max_age = settings.PROXY_FRESH_SECONDS if max_age is None else max_age
+    return bool(proxy.last_checked and datetime.utcnow() - proxy.last_checked <= timedelta(seconds=max_age))
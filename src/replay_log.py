@@ -0,0 +1,157 @@
+"""
+Лог одного реплея: уровни, сэмплирование частых событий, буфер и пакетный вывод.
+
+log() писал каждую строку через print + sys.stdout.flush(): hover, wheel и
+keydown дают по строке на событие, и длинная запись превращалась в десятки
+тысяч синхронных записей в stdout воркера Celery. RunLogger привязан к
+прогону (тег, номер шага) и:
+  • отбрасывает из вывода строки ниже REPLAY_LOG_LEVEL;
+  • строки шагов частых типов (SAMPLED_TYPES) выводит только каждую
+    REPLAY_LOG_SAMPLE-ю на тип — остальные идут уровнем debug;
+  • копит строки и пишет их в поток одним write пачкой REPLAY_LOG_FLUSH_LINES
+    строк или раз в REPLAY_LOG_FLUSH_SECONDS; warn и error — сразу;
+  • держит кольцевой буфер последних REPLAY_LOG_BUFFER записей всех уровней:
+    при падении dump() выводит его целиком, tail() уходит в артефакты.
+Хвост буфера выводит close() в конце прогона, а для логгеров, которые никто
+не закрыл (упавший воркер, логгер процесса), — atexit.
+REPLAY_LOG_FORMAT=json — та же запись строкой JSON с полями (для сборщиков логов).
+"""
+import atexit
+import datetime
+import json
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warn": WARN, "warning": WARN, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARN: "warn", ERROR: "error"}
+# события, которых в записи сотни: их строки шагов сэмплируются
+SAMPLED_TYPES = frozenset({"mouse_move", "hover", "hover_generic", "wheel", "scroll", "keydown", "input"})
+
+_open_loggers: "weakref.WeakSet[RunLogger]" = weakref.WeakSet()
+
+
+def level_of(msg: str) -> int:
+    """Уровень по метке, которую строки лога реплея уже несут: [WARN], !!!, ERROR."""
+    head = msg.lstrip()[:24]
+    if "ERROR" in head:
+        return ERROR
+    if head.startswith(("[WARN]", "!!!")):
+        return WARN
+    return INFO
+
+
+class RunLogger:
+    def __init__(self, tag: str = "", level: Optional[str] = None, sample_every: Optional[int] = None,
+                 capacity: Optional[int] = None, stream=None, fmt: Optional[str] = None):
+        self.tag = tag
+        self.level = LEVELS.get((level or settings.REPLAY_LOG_LEVEL).lower(), INFO)
+        self.sample_every = max(1, sample_every or settings.REPLAY_LOG_SAMPLE)
+        self.fmt = fmt or settings.REPLAY_LOG_FORMAT
+        self.stream = stream
+        self.step = 0
+        # (ts, level, step, msg, fields)
+        self.ring: deque = deque(maxlen=max(capacity or settings.REPLAY_LOG_BUFFER, settings.ARTIFACT_LOG_LINES))
+        self.counts: Counter = Counter()  # записей по уровням, вместе с не выведенными
+        self._seen: Counter = Counter()   # строк шагов по типам (для сэмплирования)
+        self._pending: List[str] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.closed = False  # после close() строки пишутся сразу, без буфера
+        _open_loggers.add(self)
+
+    # ---------- запись -----------------------------------------------------
+
+    def format(self, record: tuple) -> str:
+        ts, level, step, msg, fields = record
+        stamp = datetime.datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+        if self.fmt == "json":
+            return json.dumps({"ts": round(ts, 3), "level": LEVEL_NAMES[level], "run": self.tag or None,
+                               "step": step, "msg": msg, **fields}, ensure_ascii=False, default=str)
+        prefix = f"[{stamp}][{self.tag}:{step:04d}]" if self.tag else f"[{stamp}][{step:04d}]"
+        extra = "".join(f" {k}={v}" for k, v in fields.items())
+        return f"{prefix} {msg}{extra}"
+
+    def log(self, level: int, msg: str, step: Optional[int] = None, **fields: Any):
+        record = (time.time(), level, self.step if step is None else step, msg, fields)
+        with self._lock:
+            self.ring.append(record)
+            self.counts[level] += 1
+            if level < self.level:
+                return
+            self._pending.append(self.format(record))
+            due = (self.closed or level >= WARN or len(self._pending) >= settings.REPLAY_LOG_FLUSH_LINES
+                   or time.monotonic() - self._last_flush >= settings.REPLAY_LOG_FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def debug(self, msg: str, **fields):
+        self.log(DEBUG, msg, **fields)
+
+    def info(self, msg: str, **fields):
+        self.log(INFO, msg, **fields)
+
+    def warn(self, msg: str, **fields):
+        self.log(WARN, msg, **fields)
+
+    def error(self, msg: str, **fields):
+        self.log(ERROR, msg, **fields)
+
+    def event(self, typ: str, msg: str, **fields):
+        """Строка шага плана: частые типы выводятся только каждую sample_every-ю."""
+        seen = self._seen[typ]
+        self._seen[typ] += 1
+        sampled = typ in SAMPLED_TYPES and seen % self.sample_every
+        self.log(DEBUG if sampled else INFO, msg, **fields)
+
+    # ---------- вывод ------------------------------------------------------
+
+    def _write(self, lines: List[str]):
+        if not lines:
+            return
+        out = self.stream or sys.stdout
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        self._write(lines)
+
+    def close(self):
+        """Конец прогона: буфер — в поток; запоздавшие строки дальше пишутся без буфера."""
+        self.closed = True
+        _open_loggers.discard(self)
+        self.flush()
+
+    def dump(self, reason: str = ""):
+        """Весь кольцевой буфер (все уровни) — при падении, вместо выборочного вывода."""
+        self.flush()
+        with self._lock:
+            lines = [self.format(r) for r in self.ring]
+        header = f"----- replay log buffer{f' ({reason})' if reason else ''}: {len(lines)} records -----"
+        self._write([header] + lines + ["-" * len(header)])
+
+    def tail(self, n: Optional[int] = None) -> List[str]:
+        with self._lock:
+            records = list(self.ring)
+        return [self.format(r) for r in records[-(n or settings.ARTIFACT_LOG_LINES):]]
+
+    def summary(self) -> Dict[str, int]:
+        return {LEVEL_NAMES[k]: v for k, v in sorted(self.counts.items())}
+
+
+@atexit.register
+def _flush_open_loggers():
+    for logger in list(_open_loggers):
+        try:
+            logger.flush()
+        except Exception:
+            pass
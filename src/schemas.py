@@ -2,6 +2,9 @@ from datetime import datetime
 from typing import Optional, Any, List, Literal
 from pydantic import BaseModel, HttpUrl, Field
 
+# профили загрузки ресурсов (src.interception.RESOURCE_POLICIES)
+ResourcePolicyName = Literal["full", "no-media", "minimal"]
+
 
 class ProxyCreate(BaseModel):
     ip: str
@@ -16,6 +19,10 @@ class ProxyRead(ProxyCreate):
     id: int
     is_working: bool
     last_checked: Optional[datetime]
+    connect_ms: Optional[int] = None
+    tls_ms: Optional[int] = None
+    exit_ip: Optional[str] = None
+    check_error: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -38,6 +45,7 @@ class InstructionSetRead(InstructionSetCreate):
 class FarmTaskCreate(BaseModel):
     instruction_set_id: int
     base_session_id: Optional[int]
+    resource_policy: ResourcePolicyName = "full"
     # inplace: bool = False
 
 
@@ -47,6 +55,7 @@ class FarmTaskRead(BaseModel):
     instruction_set_id: int
     base_session_id: Optional[int]
     proxy_id: int = Field(..., alias="assigned_proxy_id")
+    resource_policy: str
     status: str
     created_at: datetime
     completed_at: Optional[datetime]
@@ -71,6 +80,7 @@ class UserSessionRead(BaseModel):
 
 class JobTaskCreate(BaseModel):
     instruction_set_id: int
+    resource_policy: ResourcePolicyName = "full"
 
 
 
@@ -78,6 +88,7 @@ class JobTaskRead(BaseModel):
     id: int
     session_id: int
     instruction_set_id: int
+    resource_policy: str
     status: str
     created_at: datetime
     completed_at: Optional[datetime]
@@ -87,6 +98,19 @@ class JobTaskRead(BaseModel):
         orm_mode = True
 
 
+class FarmReportRead(BaseModel):
+    id: int
+    farm_task_id: int
+    user_session_id: Optional[int]
+    result_text: Optional[str]
+    report_metadata: Optional[Any]
+    error: Optional[str]
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
 class JobReportRead(BaseModel):
     id: int
     job_task_id: int
@@ -0,0 +1,236 @@
+"""
+Ожидание «страница устоялась» вместо фиксированных пауз.
+
+replay_events спал 1.5 с после первого URL каждой вкладки, а навигации
+ждали readyState == complete — на SPA это либо мгновенно, либо ничего не
+значит. Здесь страница считается устоявшейся, когда документ уже разобран
+(readyState != loading) и SETTLE_QUIET_MS подряд:
+  • в сети не больше NETWORK_IDLE_INFLIGHT запросов (long-poll и счётчики
+    не мешают) — по Network.requestWillBeSent / loadingFinished / loadingFailed;
+  • в DOM нет вставок и правок текста — MutationObserver, внедрённый в каждый
+    документ вкладки; атрибуты не смотрим, иначе карусели не дают устояться.
+
+Сколько обычно устаивается каждый домен, запоминается в таблице
+domain_settle_stats (скользящее среднее). SettleBook даёт из этого окно
+ожидания: не раньше половины среднего (ранняя тишина между DOMContentLoaded
+и первыми XHR — ещё не конец) и не дольше среднего с запасом; для
+незнакомого домена — до SETTLE_MAX_SECONDS. Домен, который почти никогда не
+затихает (SETTLE_NOISY_AFTER таймаутов и их больше, чем удачных замеров), ждал
+бы полный потолок на каждой навигации — для него ожидание кончается через
+SETTLE_NOISY_PAUSE_MS после load документа. Успеть затихнуть он может и так:
+такие замеры уменьшают перевес таймаутов. Задача загружает книгу из БД
+перед реплеем и сохраняет новые замеры после.
+
+Если у вкладки нет канала с событиями (DriverCDP), вызывающий код ждёт
+загрузку документа, как раньше.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from src.config import settings
+
+NETWORK_IDLE_INFLIGHT = 2
+POLL_INTERVAL = 0.1
+EWMA_ALPHA = 0.3   # вес нового замера в среднем по домену
+HEADROOM = 2.0     # потолок ожидания — среднее × HEADROOM + окно тишины
+
+SETTLE_JS = r"""
+(() => {
+  const KEY = Symbol.for("replay.settle");
+  if (window[KEY]) return;
+  const state = {last: performance.now()};
+  Object.defineProperty(window, KEY, {value: state});
+  new MutationObserver(() => { state.last = performance.now(); })
+    .observe(document, {childList: true, subtree: true, characterData: true});
+})();
+"""
+# [мс без мутаций DOM (-1 — наблюдателя нет), document.readyState]
+PROBE_JS = r"""
+(() => {
+  const s = window[Symbol.for("replay.settle")];
+  return [s ? performance.now() - s.last : -1, document.readyState];
+})()
+"""
+
+
+def settle_host(url: str) -> str:
+    return (urlsplit(url or "").hostname or "").lower()
+
+
+@dataclass
+class DomainSettle:
+    samples: int = 0
+    avg_ms: float = 0.0
+    timeouts: int = 0
+
+
+class SettleBook:
+    """Выученные времена устаивания по доменам и замеры одного реплея."""
+
+    def __init__(self, known: Optional[Dict[str, DomainSettle]] = None):
+        self.stats: Dict[str, DomainSettle] = dict(known or {})
+        self.dirty: set = set()
+        self.waited = 0.0
+        self.waits = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def noisy(self, host: str) -> bool:
+        """Домен почти всегда упирается в потолок — ждать его целиком бесполезно."""
+        st = self.stats.get(host)
+        return bool(st) and st.timeouts >= settings.SETTLE_NOISY_AFTER and st.timeouts > st.samples
+
+    def window(self, host: str) -> Tuple[float, float]:
+        """(не раньше, не позже) в секундах для ожидания на host."""
+        quiet = settings.SETTLE_QUIET_MS / 1000
+        st = self.stats.get(host)
+        if not st or not st.samples:
+            return 0.0, settings.SETTLE_MAX_SECONDS
+        avg = st.avg_ms / 1000
+        return avg / 2, min(max(avg * HEADROOM + quiet, quiet * 2), settings.SETTLE_MAX_SECONDS)
+
+    def record(self, host: str, settled_ms: float, waited: float, timed_out: bool):
+        with self._lock:
+            self.waited += waited
+            self.waits += 1
+            if not host:
+                return
+            st = self.stats.setdefault(host, DomainSettle())
+            if timed_out:
+                # страница так и не затихла — среднее не трогаем, иначе окно поползёт к максимуму
+                self.timeouts += 1
+                st.timeouts += 1
+            else:
+                st.avg_ms = settled_ms if not st.samples else st.avg_ms + EWMA_ALPHA * (settled_ms - st.avg_ms)
+                st.samples += 1
+            self.dirty.add(host)
+
+    def updates(self) -> List[Tuple[str, DomainSettle]]:
+        """Изменённые за реплей домены — для src.crud.save_settle_stats."""
+        with self._lock:
+            return [(host, self.stats[host]) for host in sorted(self.dirty)]
+
+    def summary(self) -> dict:
+        return {
+            "waits": self.waits, "timeouts": self.timeouts, "waited": round(self.waited, 3),
+            "domains": {h: round(self.stats[h].avg_ms) for h in sorted(self.dirty)},
+            "noisy": [h for h in sorted(self.dirty) if self.noisy(h)],
+        }
+
+
+class PageSettler:
+    """Сеть и DOM одной вкладки (или target-сессии asyncio-движка) и ожидание их тишины."""
+
+    def __init__(self, book: SettleBook):
+        self.book = book
+        self._inflight: set = set()
+        self._net_changed = time.monotonic()
+        self._loaded_at: Optional[float] = None  # readyState == complete в текущем ожидании
+        self._lock = threading.Lock()
+
+    # ---------- сеть -------------------------------------------------------
+
+    def _on_request(self, params: dict):
+        if params.get("request", {}).get("url", "").startswith("data:"):
+            return
+        with self._lock:
+            self._inflight.add(params.get("requestId"))
+            self._net_changed = time.monotonic()
+
+    def _on_done(self, params: dict):
+        with self._lock:
+            if params.get("requestId") in self._inflight:
+                self._inflight.discard(params.get("requestId"))
+                self._net_changed = time.monotonic()
+
+    def _subscribe(self, on):
+        on("Network.requestWillBeSent", self._on_request)
+        on("Network.loadingFinished", self._on_done)
+        on("Network.loadingFailed", self._on_done)
+
+    def commands(self) -> List[tuple]:
+        return [
+            ("Network.enable", {}),
+            ("Page.addScriptToEvaluateOnNewDocument", {"source": SETTLE_JS}),
+            ("Runtime.evaluate", {"expression": SETTLE_JS}),
+        ]
+
+    # ---------- решение ----------------------------------------------------
+
+    def _quiet_for(self, now: float, probe) -> Optional[float]:
+        """Сколько секунд вкладка уже тихая; None — ещё грузится."""
+        dom_quiet_ms, ready = probe if isinstance(probe, list) else (-1, "loading")
+        if ready == "loading":
+            return None
+        with self._lock:
+            if len(self._inflight) > NETWORK_IDLE_INFLIGHT:
+                return None
+            net_quiet = now - self._net_changed
+        return net_quiet if dom_quiet_ms < 0 else min(net_quiet, dom_quiet_ms / 1000)
+
+    def _step(self, host: str, t0: float, probe) -> Optional[bool]:
+        """True — устоялась, False — время вышло, None — ждём дальше."""
+        now = time.monotonic()
+        earliest, latest = self.book.window(host)
+        if isinstance(probe, list) and probe[1] == "complete" and self._loaded_at is None:
+            self._loaded_at = now
+        if self._loaded_at is not None and self.book.noisy(host):
+            # шумный домен: load + короткая пауза, а не весь потолок
+            latest = min(latest, self._loaded_at - t0 + settings.SETTLE_NOISY_PAUSE_MS / 1000)
+        quiet = self._quiet_for(now, probe)
+        settled = quiet is not None and quiet >= settings.SETTLE_QUIET_MS / 1000 and now - t0 >= earliest
+        if settled or now - t0 >= latest:
+            elapsed = now - t0
+            self.book.record(host, max(0.0, elapsed - (quiet or 0)) * 1000, elapsed, not settled)
+            return settled
+        return None
+
+    # ---------- установка и ожидание ----------------------------------------
+
+    def install(self, cdp):
+        """cdp — CDPChannel вкладки."""
+        self._subscribe(cdp.on)
+        cdp.send_batch(self.commands())
+
+    def wait(self, cdp, url: str) -> bool:
+        host, t0 = settle_host(url), time.monotonic()
+        self._loaded_at = None
+        while True:
+            try:
+                probe = cdp.send("Runtime.evaluate", {"expression": PROBE_JS, "returnByValue": True},
+                                 timeout=2)["result"].get("value")
+            except Exception:
+                probe = None  # документ меняется прямо сейчас
+            done = self._step(host, t0, probe)
+            if done is not None:
+                return done
+            time.sleep(POLL_INTERVAL)
+
+    async def install_async(self, conn, session_id: str):
+        self._subscribe(lambda event, cb: conn.on(event, cb, session_id))
+        for method, params in self.commands():
+            await conn.send(method, params, session_id)
+
+    async def wait_async(self, conn, session_id: str, url: str) -> bool:
+        host, t0 = settle_host(url), time.monotonic()
+        self._loaded_at = None
+        while True:
+            try:
+                res = await conn.send("Runtime.evaluate", {"expression": PROBE_JS, "returnByValue": True},
+                                      session_id, 2)
+                probe = res["result"].get("value")
+            except Exception:
+                probe = None
+            done = self._step(host, t0, probe)
+            if done is not None:
+                return done
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def load_book(rows: Iterable) -> SettleBook:
+    """Книга из строк domain_settle_stats (src.models.DomainSettleStat)."""
+    return SettleBook({r.domain: DomainSettle(r.samples, r.avg_ms, r.timeouts) for r in rows})
@@ -0,0 +1,205 @@
+"""
+Трассировка команд WebDriver реплея (включается явно: REPLAY_TRACE_DIR / --trace).
+
+Каждая команда Selenium — HTTP-запрос к chromedriver, а execute_cdp_cmd — ещё
+и пересылка в Chrome. CommandTracer оборачивает driver.execute (через него
+идут и execute_script, и execute_cdp_cmd) и для каждой команды пишет имя,
+задержку и шаг плана, внутри которого она ушла. Имя — это команда WebDriver,
+для executeScript — текст скрипта, для executeCdpCommand — метод CDP.
+Прямые CDP-каналы (src.cdp.CDPChannel) мимо driver.execute ходят по websocket:
+attach() оборачивает их send_nowait, такие команды идут в таблицу как ws:<метод>
+(задержка — до ответа Chrome) и на свою дорожку трассы.
+
+Внутри одного шага отмечаются лишние обращения:
+  repeat — та же команда с теми же аргументами ещё раз;
+  split  — ещё одно чтение значения отдельным скриптом ("return …" без
+           аргументов), хотя их можно забрать одним (scrollX + scrollY).
+В конце реплея — таблица по командам (вызовы, сумма, p50/p95, max) и по
+лишним обращениям, а рядом файл в формате Chrome trace (chrome://tracing,
+Perfetto): шаги и команды на отдельных дорожках.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from src.instrumentation import percentile
+
+NAME_LIMIT = 60
+STEP_TID, COMMAND_TID, CDP_TID = 1, 2, 3
+
+
+def command_name(command: str, params: Optional[dict]) -> str:
+    params = params or {}
+    if command == "executeCdpCommand":
+        return f"cdp:{params.get('cmd')}"
+    if command in ("executeScript", "executeAsyncScript", "w3cExecuteScript", "w3cExecuteScriptAsync"):
+        script = " ".join(str(params.get("script", "")).split())
+        return f"script:{script[:NAME_LIMIT]}"
+    return command
+
+
+def is_split_read(command: str, params: Optional[dict]) -> bool:
+    """Скрипт только читает значение и ничего не получает — такие можно собрать в один."""
+    if "Script" not in command:
+        return False
+    params = params or {}
+    script = str(params.get("script", "")).strip()
+    return script.startswith("return ") and not params.get("args")
+
+
+class CommandTracer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events: List[dict] = []                 # Chrome trace
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.redundant: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: {"repeat": 0, "split": 0})
+        self._step: Optional[Tuple[str, int, float]] = None  # (тип, номер, начало)
+        self._seen: set = set()
+        self._reads = 0
+        self._lock = threading.Lock()
+        self._driver = None
+        self._original = None
+        self._channels: list = []
+
+    def _us(self, t: float) -> int:
+        return int((t - self.started) * 1_000_000)
+
+    # ---------- шаги -------------------------------------------------------
+
+    def begin_step(self, typ: str, number: int):
+        self.end_step()
+        self._step = (typ, number, time.perf_counter())
+        self._seen.clear()
+        self._reads = 0
+
+    def end_step(self):
+        if self._step is None:
+            return
+        typ, number, t0 = self._step
+        self._step = None
+        self.events.append({"name": typ, "cat": "step", "ph": "X", "ts": self._us(t0),
+                            "dur": self._us(time.perf_counter()) - self._us(t0),
+                            "pid": os.getpid(), "tid": STEP_TID, "args": {"step": number}})
+
+    # ---------- команды ----------------------------------------------------
+
+    def _record(self, command: str, params: Optional[dict], t0: float, t1: float, error: Optional[str],
+                cdp: bool = False):
+        name = f"ws:{command}" if cdp else command_name(command, params)
+        with self._lock:
+            self.latency[name].append((t1 - t0) * 1000)
+            flag = None
+            if self._step is not None:
+                try:
+                    key = (command, json.dumps(params, sort_keys=True, default=str))
+                except (TypeError, ValueError):
+                    key = None
+                if key in self._seen:
+                    flag = "repeat"
+                elif is_split_read(command, params):
+                    self._reads += 1
+                    if self._reads > 1:
+                        flag = "split"
+                if key is not None:
+                    self._seen.add(key)
+                if flag:
+                    self.redundant[(self._step[0], name)][flag] += 1
+            args = {"step": self._step[1] if self._step else None}
+            if flag:
+                args["redundant"] = flag
+            if error:
+                args["error"] = error
+            self.events.append({"name": name, "cat": "cdp" if cdp else "webdriver", "ph": "X",
+                                "ts": self._us(t0), "dur": self._us(t1) - self._us(t0), "pid": os.getpid(),
+                                "tid": CDP_TID if cdp else COMMAND_TID, "args": args})
+
+    def install(self, driver):
+        """Оборачивает driver.execute; uninstall() возвращает прежний (драйвер может быть из пула)."""
+        original = driver.execute
+
+        def traced(command, params=None):
+            t0 = time.perf_counter()
+            error = None
+            try:
+                return original(command, params)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self._record(command, params, t0, time.perf_counter(), error)
+
+        self._driver, self._original = driver, original
+        driver.execute = traced
+
+    def attach(self, channel):
+        """Оборачивает send_nowait канала (через него идут и send, и send_batch); снимает uninstall()."""
+        if channel in self._channels:
+            return
+        original = channel.send_nowait
+
+        def traced(method, params=None, session_id=None):
+            t0 = time.perf_counter()
+            try:
+                fut = original(method, params, session_id)
+            except Exception as e:
+                self._record(method, params, t0, time.perf_counter(), type(e).__name__, cdp=True)
+                raise
+            fut.add_done_callback(lambda f: self._record(
+                method, params, t0, time.perf_counter(),
+                None if f.cancelled() or f.exception() is None else type(f.exception()).__name__, cdp=True))
+            return fut
+
+        channel.send_nowait = traced
+        self._channels.append(channel)
+
+    def uninstall(self):
+        if self._driver is not None:
+            self._driver.execute = self._original
+            self._driver = self._original = None
+        for channel in self._channels:
+            channel.__dict__.pop("send_nowait", None)
+        self._channels.clear()
+
+    # ---------- итог -------------------------------------------------------
+
+    def summary(self) -> dict:
+        commands = {}
+        for name, values in self.latency.items():
+            values = sorted(values)
+            commands[name] = {"calls": len(values), "total_ms": round(sum(values), 1),
+                              "p50_ms": round(percentile(values, 0.5), 1),
+                              "p95_ms": round(percentile(values, 0.95), 1), "max_ms": round(values[-1], 1)}
+        redundant = [{"event": typ, "command": name, **counts}
+                     for (typ, name), counts in sorted(self.redundant.items(),
+                                                       key=lambda kv: -(kv[1]["repeat"] + kv[1]["split"]))]
+        return {"commands": commands, "redundant": redundant}
+
+    def table(self) -> str:
+        s = self.summary()
+        lines = [f"{'command':<{NAME_LIMIT + 8}} {'calls':>6} {'total ms':>10} {'p50':>7} {'p95':>7} {'max':>7}"]
+        for name, c in sorted(s["commands"].items(), key=lambda kv: -kv[1]["total_ms"]):
+            lines.append(f"{name:<{NAME_LIMIT + 8}} {c['calls']:>6} {c['total_ms']:>10.1f} "
+                         f"{c['p50_ms']:>7.1f} {c['p95_ms']:>7.1f} {c['max_ms']:>7.1f}")
+        if s["redundant"]:
+            lines.append("")
+            lines.append(f"{'event':<16} {'command':<{NAME_LIMIT + 8}} {'repeat':>6} {'split':>6}")
+            for r in s["redundant"]:
+                lines.append(f"{r['event']:<16} {r['command']:<{NAME_LIMIT + 8}} {r['repeat']:>6} {r['split']:>6}")
+        return "\n".join(lines)
+
+    def write_trace(self, path: str) -> str:
+        self.end_step()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in ((STEP_TID, "steps"), (COMMAND_TID, "webdriver"), (CDP_TID, "cdp"))]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + self.events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+def trace_path(trace_dir: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(trace_dir, f"replay-{stamp}-{os.getpid()}-{threading.get_ident()}.trace.json")
@@ -0,0 +1,138 @@
+"""
+Кэш версии Chrome и каталог User-Agent, проиндексированный по major-версии.
+
+Раньше pick_chrome_ua на каждый вызов поднимал отдельный uc.Chrome ради
+capabilities["browserVersion"] и линейно фильтровал данные fake_useragent.
+Теперь версия читается из `chrome --version` и кэшируется на диске по
+(путь к бинарнику, mtime), а каталог UA строится один раз на процесс.
+"""
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+from typing import Optional
+
+from src.config import settings
+
+_VERSION_RE = re.compile(r"(\d+)\.(\d+)\.(\d+)\.(\d+)")
+_CHROME_MAJOR_RE = re.compile(r"Chrome/(\d+)\.")
+
+_caps_lock = threading.Lock()
+
+
+# ---------- browser capabilities -------------------------------------------
+
+def _load_caps() -> dict:
+    try:
+        with open(settings.BROWSER_CAPS_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_caps(caps: dict):
+    path = settings.BROWSER_CAPS_CACHE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(caps, f, ensure_ascii=False, indent=2)
+    # атомарная замена — параллельные воркеры не увидят полузаписанный файл
+    os.replace(tmp, path)
+
+
+def _probe_version(binary: str) -> str:
+    """Спрашивает версию у самого бинарника; если он молчит (Windows) — поднимает uc.Chrome."""
+    try:
+        out = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=10).stdout
+        m = _VERSION_RE.search(out or "")
+        if m:
+            return m.group(0)
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+    import undetected_chromedriver as uc
+    temp_driver = uc.Chrome(options=uc.ChromeOptions(), browser_executable_path=binary)
+    try:
+        caps = temp_driver.capabilities
+        return caps.get("browserVersion") or caps.get("version") or ""
+    finally:
+        temp_driver.quit()
+
+
+def detect_chrome_version(binary: Optional[str] = None) -> str:
+    """
+    Версия установленного Chrome ("124.0.6367.91") или "" если Chrome не найден.
+    Результат кэшируется в BROWSER_CAPS_CACHE по пути и mtime бинарника,
+    так что после обновления Chrome версия будет перечитана.
+    """
+    if binary is None:
+        from undetected_chromedriver import find_chrome_executable
+        binary = find_chrome_executable()
+    if not binary:
+        return ""
+    binary = os.path.realpath(binary)
+    mtime = os.path.getmtime(binary)
+
+    with _caps_lock:
+        caps = _load_caps()
+        entry = caps.get(binary)
+        if entry and entry.get("mtime") == mtime:
+            return entry.get("version", "")
+
+        version = _probe_version(binary)
+        caps[binary] = {"mtime": mtime, "version": version}
+        try:
+            _save_caps(caps)
+        except OSError:
+            pass
+        return version
+
+
+# ---------- UA catalog -----------------------------------------------------
+
+class UACatalog:
+    """Chrome-UA из fake_useragent, разложенные по major-версии."""
+
+    def __init__(self, user_agents: list[str]):
+        self.by_major: dict[str, list[str]] = {}
+        for ua in user_agents:
+            m = _CHROME_MAJOR_RE.search(ua)
+            if m:
+                self.by_major.setdefault(m.group(1), []).append(ua)
+
+    @classmethod
+    def from_fake_useragent(cls) -> "UACatalog":
+        from fake_useragent import UserAgent
+        ua = UserAgent()
+        # fake_useragent>=1.2 хранит список в data_browsers, а ua.data отдаёт fallback-строку
+        data = getattr(ua, "data_browsers", None)
+        if not isinstance(data, list):
+            data = ua.data
+        if isinstance(data, dict):
+            # старый формат: {"browsers": {"chrome": [ua, ...]}}
+            uas = data.get("browsers", {}).get("chrome", [])
+        elif isinstance(data, list):
+            # новый формат: [{"useragent": ..., "browser": "Chrome", ...}, ...]
+            uas = [e.get("useragent", "") for e in data if e.get("browser") == "Chrome"]
+        else:
+            uas = []
+        return cls(uas)
+
+    def pick(self, major: str) -> Optional[str]:
+        candidates = self.by_major.get(major)
+        return random.choice(candidates) if candidates else None
+
+
+_catalog: Optional[UACatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_ua_catalog() -> UACatalog:
+    """Каталог загружается один раз на процесс воркера."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = UACatalog.from_fake_useragent()
+        return _catalog